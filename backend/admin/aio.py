@@ -0,0 +1,34 @@
+"""
+Асинхронная точка входа функции (aio.handler) для развёртывания с несколькими одновременными вызовами на экземпляр.
+Действия и ответы те же, что у index.handler: синхронный handler выполняется в ограниченном пуле потоков,
+psycopg2 отпускает GIL на ожидании сервера, поэтому запросы в полёте перекрывают ожидания базы через общий пул соединений.
+Настройка: AIO_MAX_IN_FLIGHT (по умолчанию DB_POOL_MAX_SIZE) — сколько вызовов выполняется одновременно, остальные ждут в очереди.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from typing import Any, Dict
+import index
+from db import POOL_MAX_SIZE
+
+MAX_IN_FLIGHT = int(os.environ.get('AIO_MAX_IN_FLIGHT', str(POOL_MAX_SIZE)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=max(1, MAX_IN_FLIGHT), thread_name_prefix='aio-handler')
+    return _executor
+
+async def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if event.get('httpMethod') == 'OPTIONS':
+        return index.handler(event, context)
+    loop = asyncio.get_running_loop()
+    # Each call gets its own copy of the context, so per-request state (gzip flag, timings) never leaks between calls
+    call = contextvars.copy_context().run
+    return await loop.run_in_executor(_get_executor(), call, index.handler, event, context)
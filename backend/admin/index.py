@@ -1,171 +1,497 @@
 """
 Админ-панель для управления пользователями и энергией.
 Только для администраторов: выдача/списание энергии, просмотр статистики, управление пользователями.
+export_table и import_rows переносят users и energy_transactions пачками через COPY в CSV или NDJSON.
+Чтения (проверка администратора, статистика, списки, поиск, выгрузка) идут на реплику, если она настроена (db.py).
+get_stats и get_users отдают ETag из счётчиков изменений (V0011); с совпавшим If-None-Match ответ — 304 без тела.
 """
+import base64
+import hashlib
+import io
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
-
-def cors_headers() -> Dict[str, str]:
-    return {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-        'Access-Control-Max-Age': '86400'
-    }
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from db import (
+    PoolTimeout, dict_cursor, driver, execute_prepared, get_db_connection, get_pool, in_read_only_snapshot, is_replica,
+    note_write, prepare_statement, read_your_writes, routing_stats, set_writer
+)
+from responses import (
+    begin_request, etag_matches, header, json_response, not_modified_response, preflight_response, text_response
+)
+from session_cache import session_cache
+from tokens import is_signed_token, parse_token, is_revoked
+from timing import instrumented, set_action, snapshot
+from batch import parse_batch, run_batch
+
+STATS_SNAPSHOT_MAX_AGE = int(os.environ.get('STATS_SNAPSHOT_MAX_AGE', '60'))
+# Actions allowed in a read-only batch snapshot
+READ_ACTIONS = frozenset({
+    'get_stats', 'get_transactions_series', 'get_users', 'search_users', 'get_cache_stats', 'get_timing_stats'
+})
+
+# verify_admin runs on every admin request; both lookups are parsed and planned once per pooled connection
+ADMIN_BY_ID = prepare_statement('admin_user_by_id', """
+    SELECT id, is_admin, to_timestamp(%s)::timestamp AS expires_at
+    FROM users WHERE id = %s""")
+ADMIN_SESSION = prepare_statement('admin_session_user', """
+    SELECT u.id, u.is_admin, s.expires_at
+    FROM sessions s
+    JOIN users u ON s.user_id = u.id
+    WHERE s.session_token = %s AND s.expires_at > CURRENT_TIMESTAMP""")
 
 def verify_admin(token: str) -> Dict[str, Any]:
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """SELECT u.id, u.is_admin
-                   FROM sessions s
-                   JOIN users u ON s.user_id = u.id
-                   WHERE s.session_token = %s AND s.expires_at > CURRENT_TIMESTAMP""",
-                (token,)
-            )
-            user = cur.fetchone()
-            
-            if not user or not user['is_admin']:
-                return None
-            return user
-    finally:
-        conn.close()
+    claims = None
+    if is_signed_token(token):
+        claims = parse_token(token)
+        if claims is None or is_revoked(claims, get_db_connection):
+            return None
+    
+    user = session_cache.get(token)
+    
+    if user is None:
+        def read(read_only: bool) -> Optional[Dict[str, Any]]:
+            with get_db_connection(read_only) as conn:
+                with dict_cursor(conn) as cur:
+                    if claims is not None:
+                        execute_prepared(cur, ADMIN_BY_ID, (claims['expiresAt'], claims['userId']))
+                    else:
+                        execute_prepared(cur, ADMIN_SESSION, (token,))
+                    return cur.fetchone()
+        
+        row = read_your_writes(read)
+        
+        if not row:
+            return None
+        user = {'id': row['id'], 'is_admin': row['is_admin']}
+        session_cache.put(token, user['id'], user, row['expires_at'])
+    
+    if not user['is_admin']:
+        return None
+    return user
 
+@instrumented('admin')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': cors_headers(),
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight_response()
+    
+    begin_request(event)
     
     try:
-        headers = event.get('headers', {})
-        token = headers.get('x-auth-token', headers.get('X-Auth-Token', ''))
+        token = header(event, 'X-Auth-Token')
         
         if not token:
-            return {
-                'statusCode': 401,
-                'headers': cors_headers(),
-                'body': json.dumps({'error': 'Authentication required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(401, {'error': 'Authentication required'})
         
         admin = verify_admin(token)
         if not admin:
-            return {
-                'statusCode': 403,
-                'headers': cors_headers(),
-                'body': json.dumps({'error': 'Admin access required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(403, {'error': 'Admin access required'})
+        # Read-your-writes is per admin: one admin's writes do not pin everyone's reads to the primary
+        set_writer(admin['id'])
         
         body_data = json.loads(event.get('body', '{}'))
-        action = body_data.get('action', '')
+        batch = parse_batch(body_data)
+        if batch is not None:
+            set_action('batch')
+            response = run_batch(batch, dispatch, READ_ACTIONS)
+            if not batch['snapshot']:
+                note_write()
+            return response
         
+        action = body_data.get('action', '')
+        set_action(action)
+        response = dispatch(body_data)
+        if action not in READ_ACTIONS:
+            # This admin reads their own changes back from the primary for a while, not from a lagging replica
+            note_write()
+        return response
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+def dispatch(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    action = body_data.get('action', '')
+    
+    try:
         if action == 'get_stats':
-            return get_statistics()
+            return get_statistics(body_data)
+        elif action == 'get_transactions_series':
+            return get_transactions_series(body_data)
         elif action == 'get_users':
-            return get_all_users()
+            return get_all_users(body_data)
+        elif action == 'search_users':
+            return search_users(body_data)
         elif action == 'update_energy':
             return update_user_energy(body_data)
+        elif action == 'bulk_update_energy':
+            return bulk_update_energy(body_data)
         elif action == 'toggle_infinite_energy':
             return toggle_infinite_energy(body_data)
+        elif action == 'export_table':
+            return export_table(body_data)
+        elif action == 'import_rows':
+            return import_rows(body_data)
+        elif action == 'get_cache_stats':
+            return get_cache_stats()
+        elif action == 'get_timing_stats':
+            return get_timing_stats()
         else:
-            return {
-                'statusCode': 400,
-                'headers': cors_headers(),
-                'body': json.dumps({'error': 'Invalid action'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'Invalid action'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-
-def get_statistics() -> Dict[str, Any]:
-    conn = get_db_connection()
+        return json_response(500, {'error': str(e)})
+
+def refresh_active_sessions(cur) -> Optional[Dict[str, Any]]:
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('stats_snapshots.active_sessions')) AS locked")
+    if not cur.fetchone()['locked']:
+        return None
+    cur.execute("""
+        INSERT INTO stats_snapshots (name, value, computed_at)
+        SELECT 'active_sessions', COUNT(*), CURRENT_TIMESTAMP
+        FROM sessions WHERE expires_at > CURRENT_TIMESTAMP
+        ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, computed_at = EXCLUDED.computed_at
+        RETURNING value AS active_sessions, computed_at
+    """)
+    return cur.fetchone()
+
+def refresh_on_primary() -> Optional[Dict[str, Any]]:
+    # Own connection, outside any pinned batch. No waiting for the pool: the caller already holds
+    # a connection, and if the pool is exhausted the stored value is served and the next call refreshes
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT COUNT(*) as total_users FROM users")
-            total_users = cur.fetchone()['total_users']
-            
-            cur.execute("SELECT COUNT(*) as active_sessions FROM sessions WHERE expires_at > CURRENT_TIMESTAMP")
-            active_sessions = cur.fetchone()['active_sessions']
-            
-            cur.execute("SELECT SUM(energy) as total_energy FROM users WHERE is_infinite_energy = FALSE")
-            total_energy = cur.fetchone()['total_energy'] or 0
+        with get_pool().connection(timeout=0) as conn:
+            with dict_cursor(conn) as cur:
+                refreshed = refresh_active_sessions(cur)
+                conn.commit()
+                return refreshed
+    except PoolTimeout:
+        return None
+
+def version_etag(kind: str, *parts: Any) -> str:
+    digest = hashlib.md5(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+    return f'W/"{kind}-{digest[:20]}"'
+
+# Everything get_stats depends on besides the ledger totals, in one round trip; the counters include
+# version_users and version_ledger, so together with the snapshot they are the ETag source
+STATS_HEAD = """
+    SELECT s.value AS active_sessions, s.computed_at,
+           s.computed_at IS NULL OR s.computed_at < CURRENT_TIMESTAMP - make_interval(secs => %s) AS stale,
+           (SELECT json_object_agg(name, value)
+            FROM (SELECT name, SUM(value)::bigint AS value FROM stats_counters GROUP BY name) c) AS counters
+    FROM (SELECT 1) one
+    LEFT JOIN stats_snapshots s ON s.name = 'active_sessions'"""
+
+def get_statistics(data: Dict[str, Any]) -> Dict[str, Any]:
+    with get_db_connection(read_only=True) as conn:
+        with dict_cursor(conn) as cur:
+            cur.execute(STATS_HEAD, (STATS_SNAPSHOT_MAX_AGE,))
+            head = cur.fetchone()
+            if head['stale']:
+                # Neither a read-only batch snapshot nor a replica can write the refresh, so it goes to the
+                # primary on a connection of its own; this response already carries the fresh value
+                if in_read_only_snapshot() or is_replica(conn):
+                    refreshed = refresh_on_primary()
+                else:
+                    refreshed = refresh_active_sessions(cur)
+                    conn.commit()
+                if refreshed:
+                    head = {**head, **refreshed}
             
-            cur.execute("SELECT AVG(energy) as avg_energy FROM users WHERE is_infinite_energy = FALSE")
-            avg_energy = cur.fetchone()['avg_energy'] or 0
+            counters = head['counters'] or {}
+            active_sessions = head['active_sessions'] or 0
+            # computedAt is part of the body, so a refresh that kept the same values still changes the tag
+            etag = version_etag('stats', counters, active_sessions, head['computed_at'])
+            if etag_matches(etag, data.get('ifNoneMatch')):
+                return not_modified_response(etag)
             
+            # All-time totals: daily rollups plus the short tail the rollup job has not reached yet
             cur.execute("""
-                SELECT transaction_type, COUNT(*) as count, SUM(amount) as total
-                FROM energy_transactions
+                SELECT transaction_type, SUM(count)::bigint as count, SUM(total)::bigint as total
+                FROM (
+                    SELECT transaction_type, count, total FROM energy_transactions_daily
+                    UNION ALL
+                    SELECT transaction_type, COUNT(*), SUM(amount)
+                    FROM energy_transactions
+                    WHERE id > (SELECT last_id FROM energy_rollup_watermark)
+                    GROUP BY transaction_type
+                ) t
                 GROUP BY transaction_type
             """)
             transactions = cur.fetchall()
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({
-                    'totalUsers': total_users,
-                    'activeSessions': active_sessions,
-                    'totalEnergy': int(total_energy),
-                    'avgEnergy': round(float(avg_energy), 2),
-                    'transactions': [dict(t) for t in transactions]
-                }),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
-
-def get_all_users() -> Dict[str, Any]:
-    conn = get_db_connection()
+            finite_users = counters.get('finite_users', 0)
+            total_energy = counters.get('finite_energy', 0)
+            
+            return json_response(200, {
+                'totalUsers': counters.get('total_users', 0),
+                'activeSessions': active_sessions,
+                'totalEnergy': int(total_energy),
+                'avgEnergy': round(total_energy / finite_users, 2) if finite_users else 0,
+                'transactions': transactions,
+                'computedAt': head['computed_at']
+            }, {'ETag': etag})
+
+SERIES_BUCKETS = ('day', 'week', 'month')
+SERIES_MAX_DAYS = 3660
+
+def get_transactions_series(data: Dict[str, Any]) -> Dict[str, Any]:
+    bucket = data.get('bucket', 'day')
+    types = data.get('types')
+    
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT id, email, username, energy, is_infinite_energy, is_admin, 
-                       created_at, last_login
+        date_from = parse_timestamp(data, 'from')
+        date_to = parse_timestamp(data, 'to')
+        if date_from is None or date_to is None:
+            raise ValueError('from and to are required')
+        if bucket not in SERIES_BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(SERIES_BUCKETS)}")
+        if date_to < date_from or (date_to - date_from).days > SERIES_MAX_DAYS:
+            raise ValueError(f'Date range must be between 0 and {SERIES_MAX_DAYS} days')
+        if types is not None and (not isinstance(types, list) or not all(isinstance(t, str) for t in types)):
+            raise ValueError('types must be a list of strings')
+    except ValueError as e:
+        return json_response(400, {'error': str(e)})
+    
+    with get_db_connection(read_only=True) as conn:
+        with dict_cursor(conn) as cur:
+            cur.execute(
+                """SELECT date_trunc(%(bucket)s, day)::date AS period, transaction_type AS "transactionType",
+                          SUM(count)::bigint AS count, SUM(total)::bigint AS total
+                   FROM energy_transactions_daily
+                   WHERE day >= %(date_from)s::date AND day <= %(date_to)s::date
+                     AND (%(types)s::varchar[] IS NULL OR transaction_type = ANY(%(types)s::varchar[]))
+                   GROUP BY period, transaction_type
+                   ORDER BY period, transaction_type""",
+                {'bucket': bucket, 'date_from': date_from, 'date_to': date_to, 'types': types}
+            )
+            rows = cur.fetchall()
+            cur.execute("SELECT last_id, updated_at FROM energy_rollup_watermark")
+            watermark = cur.fetchone()
+            
+            return json_response(200, {
+                'bucket': bucket,
+                'from': date_from.date(),
+                'to': date_to.date(),
+                'series': rows,
+                'rolledUpAt': watermark['updated_at'] if watermark else None
+            })
+
+# users.energy, energy_transactions.amount and the id columns are INTEGER
+INT_MAX = 2147483647
+
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 500
+
+# API sort name -> SQL expression; every one is backed by a (expression, id) index
+USER_SORT_COLUMNS = {
+    'createdAt': 'created_at',
+    'lastLogin': "COALESCE(last_login, '-infinity'::timestamp)",
+    'energy': 'energy',
+    'id': 'id'
+}
+USER_SORT_CASTS = {
+    'createdAt': 'timestamp',
+    'lastLogin': 'timestamp',
+    'energy': 'integer',
+    'id': 'integer'
+}
+
+def encode_cursor(sort: str, order: str, sort_key: str, user_id: int) -> str:
+    raw = json.dumps([sort, order, sort_key, user_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    try:
+        cursor_sort, cursor_order, sort_key, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort or cursor_order != order:
+        raise ValueError('Cursor does not match sort order')
+    # The key is bound into a typed comparison, so anything the cast would reject is a client error here
+    try:
+        if not isinstance(sort_key, str) or not isinstance(user_id, int) or isinstance(user_id, bool):
+            raise ValueError
+        if USER_SORT_CASTS[sort] == 'integer':
+            sort_key = int(sort_key)
+            if not -INT_MAX <= sort_key <= INT_MAX:
+                raise ValueError
+        elif not (sort == 'lastLogin' and sort_key == '-infinity'):
+            sort_key = datetime.fromisoformat(sort_key)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    return sort_key, user_id
+
+def parse_timestamp(data: Dict[str, Any], key: str) -> Optional[datetime]:
+    value = data.get(key)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f'{key} must be an ISO 8601 timestamp')
+
+# Range filters -> (sort they need, operator). A range is only index-backed on the column the page is sorted by:
+# (column, id) then serves it as one bounded range scan. On any other sort the scan would walk the sort index
+# and discard rows until the page fills, so such combinations are rejected. Flag filters combine with any sort:
+# true is rare and bounded by the partial indexes of V0005, false keeps nearly every row.
+USER_RANGE_FILTERS = {
+    'minEnergy': ('energy', '>='),
+    'maxEnergy': ('energy', '<='),
+    'createdFrom': ('createdAt', '>='),
+    'createdTo': ('createdAt', '<'),
+    'lastLoginFrom': ('lastLogin', '>='),
+    'lastLoginTo': ('lastLogin', '<')
+}
+
+def build_user_filters(data: Dict[str, Any], sort: str) -> Tuple[List[str], List[Any]]:
+    conditions: List[str] = []
+    params: List[Any] = []
+    
+    for key, column in (('isAdmin', 'is_admin'), ('isInfiniteEnergy', 'is_infinite_energy')):
+        value = data.get(key)
+        if value is not None:
+            if not isinstance(value, bool):
+                raise ValueError(f'{key} must be a boolean')
+            conditions.append(f'{column} = %s')
+            params.append(value)
+    
+    for key, (range_sort, operator) in USER_RANGE_FILTERS.items():
+        if data.get(key) is None:
+            continue
+        if range_sort != sort:
+            raise ValueError(f'{key} requires sort={range_sort}')
+        if range_sort == 'energy':
+            value = data[key]
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f'{key} must be an integer')
+        else:
+            value = parse_timestamp(data, key)
+        # Compared on the sort expression itself, so the (expression, id) index serves the range
+        conditions.append(f'{USER_SORT_COLUMNS[sort]} {operator} %s')
+        params.append(value)
+    
+    # Users who never logged in sort as -infinity but never match a login window
+    if sort == 'lastLogin' and (data.get('lastLoginFrom') is not None or data.get('lastLoginTo') is not None):
+        conditions.append(f"{USER_SORT_COLUMNS[sort]} > '-infinity'::timestamp")
+    
+    return conditions, params
+
+def get_all_users(data: Dict[str, Any]) -> Dict[str, Any]:
+    sort = data.get('sort', 'createdAt')
+    order = str(data.get('order', 'desc')).lower()
+    
+    if sort not in USER_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return json_response(400, {
+            'error': f"sort must be one of {', '.join(USER_SORT_COLUMNS)} and order asc or desc"
+        })
+    
+    try:
+        limit = min(max(int(data.get('limit', USERS_PAGE_SIZE)), 1), USERS_MAX_PAGE_SIZE)
+        conditions, params = build_user_filters(data, sort)
+        cursor = data.get('cursor')
+        if cursor:
+            sort_key, last_id = decode_cursor(cursor, sort, order)
+            comparison = '<' if order == 'desc' else '>'
+            conditions.append(f'({USER_SORT_COLUMNS[sort]}, id) {comparison} (%s::{USER_SORT_CASTS[sort]}, %s)')
+            params.extend([sort_key, last_id])
+    except (ValueError, TypeError) as e:
+        return json_response(400, {'error': str(e)})
+    
+    sort_expression = USER_SORT_COLUMNS[sort]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    direction = order.upper()
+    
+    with get_db_connection(read_only=True) as conn:
+        with dict_cursor(conn) as cur:
+            # Any write to users bumps version_users, so an unchanged version means an unchanged page
+            cur.execute("SELECT COALESCE(SUM(value), 0)::bigint AS version FROM stats_counters WHERE name = 'version_users'")
+            etag = version_etag('users', cur.fetchone()['version'], sort, order, limit, conditions, params)
+            if etag_matches(etag, data.get('ifNoneMatch')):
+                return not_modified_response(etag)
+            
+            # Columns come back already named as the API fields; the serializer encodes timestamps itself
+            cur.execute(f"""
+                SELECT id, email, username, energy,
+                       is_infinite_energy AS "isInfiniteEnergy", is_admin AS "isAdmin",
+                       created_at AS "createdAt", last_login AS "lastLogin"
                 FROM users
-                ORDER BY created_at DESC
-            """)
+                {where}
+                ORDER BY {sort_expression} {direction}, id {direction}
+                LIMIT %s
+            """, (*params, limit + 1))
             users = cur.fetchall()
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({
-                    'users': [{
-                        'id': u['id'],
-                        'email': u['email'],
-                        'username': u['username'],
-                        'energy': u['energy'],
-                        'isInfiniteEnergy': u['is_infinite_energy'],
-                        'isAdmin': u['is_admin'],
-                        'createdAt': u['created_at'].isoformat() if u['created_at'] else None,
-                        'lastLogin': u['last_login'].isoformat() if u['last_login'] else None
-                    } for u in users]
-                }),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            next_cursor = None
+            if len(users) > limit:
+                users = users[:limit]
+                last = users[-1]
+                sort_key = '-infinity' if last[sort] is None else str(last[sort])
+                next_cursor = encode_cursor(sort, order, sort_key, last['id'])
+            
+            return json_response(200, {
+                'users': users,
+                'nextCursor': next_cursor,
+                'limit': limit
+            }, {'ETag': etag})
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_MAX_LENGTH = 100
+# Trigram indexes only help substring patterns of three or more characters; shorter queries are prefix-only
+SEARCH_SUBSTRING_MIN_LENGTH = 3
+SEARCH_COLUMNS = """id, email, username, energy, is_infinite_energy, is_admin, created_at, last_login"""
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_users(data: Dict[str, Any]) -> Dict[str, Any]:
+    query = data.get('query')
+    
+    if not isinstance(query, str) or not query.strip():
+        return json_response(400, {'error': 'query is required'})
+    
+    query = query.strip().lower()
+    if len(query) > SEARCH_MAX_LENGTH:
+        return json_response(400, {'error': f'query must be at most {SEARCH_MAX_LENGTH} characters'})
+    
+    try:
+        limit = min(max(int(data.get('limit', SEARCH_LIMIT)), 1), SEARCH_MAX_LIMIT)
+    except (ValueError, TypeError):
+        return json_response(400, {'error': 'limit must be an integer'})
+    
+    # Each branch is a bounded index scan: btree range for prefixes, trigram bitmap scan for substrings.
+    # Prefix branches sort with the text_pattern_ops operator (~<~) so the index supplies the order and the scan
+    # stops at the limit; the collation's ORDER BY would read and sort every row sharing a short prefix
+    branches = [
+        f"(SELECT {SEARCH_COLUMNS}, TRUE AS prefix FROM users WHERE lower(email) LIKE %(prefix)s "
+        f"ORDER BY lower(email) USING ~<~ LIMIT %(limit)s)",
+        f"(SELECT {SEARCH_COLUMNS}, TRUE AS prefix FROM users WHERE lower(username) LIKE %(prefix)s "
+        f"ORDER BY lower(username) USING ~<~ LIMIT %(limit)s)"
+    ]
+    if len(query) >= SEARCH_SUBSTRING_MIN_LENGTH:
+        branches.append(
+            f"(SELECT {SEARCH_COLUMNS}, FALSE AS prefix FROM users "
+            f"WHERE lower(email) LIKE %(contains)s OR lower(username) LIKE %(contains)s LIMIT %(limit)s)"
+        )
+    
+    pattern = escape_like(query)
+    with get_db_connection(read_only=True) as conn:
+        with dict_cursor(conn) as cur:
+            cur.execute(f"""
+                SELECT id, email, username, energy,
+                       is_infinite_energy AS "isInfiniteEnergy", is_admin AS "isAdmin",
+                       created_at AS "createdAt", last_login AS "lastLogin",
+                       CASE WHEN prefix THEN 'prefix' ELSE 'substring' END AS "match"
+                FROM (
+                    SELECT DISTINCT ON (id) *
+                    FROM ({' UNION ALL '.join(branches)}) matches
+                    ORDER BY id, prefix DESC
+                ) ranked
+                ORDER BY prefix DESC, lower(username), id
+                LIMIT %(limit)s
+            """, {'prefix': pattern + '%', 'contains': '%' + pattern + '%', 'limit': limit})
+            users = cur.fetchall()
+    
+    return json_response(200, {'users': users, 'query': query, 'limit': limit})
 
 def update_user_energy(data: Dict[str, Any]) -> Dict[str, Any]:
     user_id = data.get('userId')
@@ -173,34 +499,18 @@ def update_user_energy(data: Dict[str, Any]) -> Dict[str, Any]:
     transaction_type = data.get('type', 'admin_adjustment')
     
     if not user_id or amount is None:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'User ID and amount are required'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        return json_response(400, {'error': 'User ID and amount are required'})
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
             cur.execute("SELECT energy, is_infinite_energy FROM users WHERE id = %s", (user_id,))
             user = cur.fetchone()
             
             if not user:
-                return {
-                    'statusCode': 404,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'User not found'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(404, {'error': 'User not found'})
             
             if user['is_infinite_energy']:
-                return {
-                    'statusCode': 400,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'User has infinite energy'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(400, {'error': 'User has infinite energy'})
             
             new_energy = max(0, user['energy'] + amount)
             cur.execute("UPDATE users SET energy = %s WHERE id = %s", (new_energy, user_id))
@@ -211,50 +521,317 @@ def update_user_energy(data: Dict[str, Any]) -> Dict[str, Any]:
                 (user_id, amount, transaction_type, f'Admin adjustment: {amount}')
             )
             conn.commit()
+            session_cache.invalidate_user(user_id)
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({'success': True, 'newEnergy': new_energy}),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            return json_response(200, {'success': True, 'newEnergy': new_energy})
+
+BULK_ENERGY_MAX_ITEMS = int(os.environ.get('BULK_ENERGY_MAX_ITEMS', '5000'))
+
+def bulk_update_energy(data: Dict[str, Any]) -> Dict[str, Any]:
+    adjustments = data.get('adjustments')
+    
+    if not isinstance(adjustments, list) or not adjustments:
+        return json_response(400, {'error': 'adjustments must be a non-empty list of {userId, amount, type}'})
+    
+    if len(adjustments) > BULK_ENERGY_MAX_ITEMS:
+        return json_response(400, {'error': f'At most {BULK_ENERGY_MAX_ITEMS} adjustments per request'})
+    
+    user_ids: List[int] = []
+    amounts: List[int] = []
+    types: List[str] = []
+    for index, item in enumerate(adjustments):
+        user_id = item.get('userId') if isinstance(item, dict) else None
+        amount = item.get('amount') if isinstance(item, dict) else None
+        transaction_type = item.get('type', 'admin_adjustment') if isinstance(item, dict) else None
+        if (not isinstance(user_id, int) or isinstance(user_id, bool) or not 0 < user_id <= INT_MAX
+                or not isinstance(amount, int) or isinstance(amount, bool) or not -INT_MAX <= amount <= INT_MAX
+                or not isinstance(transaction_type, str) or not 0 < len(transaction_type) <= 50):
+            return json_response(400, {'error': f'Invalid adjustment at index {index}'})
+        user_ids.append(user_id)
+        amounts.append(amount)
+        types.append(transaction_type)
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
+            # Several adjustments for one user are applied as their net amount; every one still gets a ledger row.
+            # Rows are locked in id order so concurrent bulk updates cannot deadlock. Net amounts are summed as
+            # bigint and the balance is clamped to the column range, so no combination of items overflows.
+            cur.execute(
+                """WITH input AS (
+                       SELECT * FROM unnest(%s::int[], %s::int[], %s::varchar[])
+                           WITH ORDINALITY AS t(user_id, amount, transaction_type, ord)
+                   ),
+                   per_user AS (
+                       SELECT user_id, SUM(amount::bigint) AS amount FROM input GROUP BY user_id
+                   ),
+                   locked AS (
+                       SELECT id, is_infinite_energy FROM users
+                       WHERE id IN (SELECT user_id FROM per_user)
+                       ORDER BY id
+                       FOR UPDATE
+                   ),
+                   updated AS (
+                       UPDATE users u SET energy = LEAST(%s, GREATEST(0, u.energy + p.amount))::int
+                       FROM per_user p
+                       JOIN locked l ON l.id = p.user_id
+                       WHERE u.id = p.user_id AND NOT l.is_infinite_energy
+                       RETURNING u.id, u.energy
+                   ),
+                   ledger AS (
+                       INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+                       SELECT i.user_id, i.amount, i.transaction_type, 'Admin adjustment: ' || i.amount
+                       FROM input i
+                       JOIN updated up ON up.id = i.user_id
+                       ORDER BY i.ord
+                       RETURNING user_id
+                   )
+                   SELECT p.user_id, l.id IS NOT NULL AS found, l.is_infinite_energy, up.energy AS new_energy
+                   FROM per_user p
+                   LEFT JOIN locked l ON l.id = p.user_id
+                   LEFT JOIN updated up ON up.id = p.user_id
+                   ORDER BY p.user_id""",
+                (user_ids, amounts, types, INT_MAX)
+            )
+            rows = cur.fetchall()
+            conn.commit()
+    
+    results = []
+    for row in rows:
+        if not row['found']:
+            status = 'not_found'
+        elif row['is_infinite_energy']:
+            status = 'infinite_energy'
+        else:
+            status = 'updated'
+            session_cache.invalidate_user(row['user_id'])
+        results.append({'userId': row['user_id'], 'status': status, 'newEnergy': row['new_energy']})
+    
+    return json_response(200, {
+        'success': True,
+        'updated': sum(1 for r in results if r['status'] == 'updated'),
+        'skippedInfiniteEnergy': [r['userId'] for r in results if r['status'] == 'infinite_energy'],
+        'notFound': [r['userId'] for r in results if r['status'] == 'not_found'],
+        'results': results
+    })
 
 def toggle_infinite_energy(data: Dict[str, Any]) -> Dict[str, Any]:
     user_id = data.get('userId')
     
     if not user_id:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'User ID is required'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        return json_response(400, {'error': 'User ID is required'})
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
             cur.execute("SELECT is_infinite_energy FROM users WHERE id = %s", (user_id,))
             user = cur.fetchone()
             
             if not user:
-                return {
-                    'statusCode': 404,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'User not found'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(404, {'error': 'User not found'})
             
             new_value = not user['is_infinite_energy']
             cur.execute("UPDATE users SET is_infinite_energy = %s WHERE id = %s", (new_value, user_id))
             conn.commit()
+            session_cache.invalidate_user(user_id)
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({'success': True, 'isInfiniteEnergy': new_value}),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            return json_response(200, {'success': True, 'isInfiniteEnergy': new_value})
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '10000'))
+EXPORT_MAX_CHUNK_ROWS = 100000
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '100000'))
+TRANSFER_FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+# One JSON document per line: CSV mode with control characters that JSON text never contains unescaped,
+# so COPY neither quotes nor backslash-escapes the document
+NDJSON_COPY_OPTIONS = "FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02'"
+EXPORT_COLUMNS = {
+    # password_hash and reset codes never leave the database
+    'users': 'id, email, username, energy, is_infinite_energy, is_admin, created_at, last_login',
+    'energy_transactions': 'id, user_id, amount, transaction_type, description, created_at'
+}
+
+def export_table(data: Dict[str, Any]) -> Dict[str, Any]:
+    table = data.get('table')
+    export_format = data.get('format', 'csv')
+    
+    if table not in EXPORT_COLUMNS or export_format not in TRANSFER_FORMATS:
+        return json_response(400, {
+            'error': f"table must be one of {', '.join(EXPORT_COLUMNS)} and format one of {', '.join(TRANSFER_FORMATS)}"
+        })
+    
+    try:
+        limit = min(max(int(data.get('limit', EXPORT_CHUNK_ROWS)), 1), EXPORT_MAX_CHUNK_ROWS)
+        after = int(data.get('cursor') or 0)
+        conditions, params = ['id > %s'], [after]
+        if table == 'energy_transactions':
+            # Bounds on created_at let the planner skip whole monthly partitions
+            for key, operator in (('from', '>='), ('to', '<')):
+                value = parse_timestamp(data, key)
+                if value is not None:
+                    conditions.append(f'created_at {operator} %s')
+                    params.append(value)
+    except (ValueError, TypeError) as e:
+        return json_response(400, {'error': str(e)})
+    
+    where = ' AND '.join(conditions)
+    with get_db_connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            # The chunk end comes from an id-only walk, so the COPY below has an exact range and the next cursor is known
+            cur.execute(
+                f"SELECT MAX(id), COUNT(*) FROM (SELECT id FROM {table} WHERE {where} ORDER BY id LIMIT %s) chunk",
+                (*params, limit)
+            )
+            last_id, rows = cur.fetchone()
+            buffer = io.BytesIO()
+            if rows:
+                query = cur.mogrify(
+                    f"SELECT {EXPORT_COLUMNS[table]} FROM {table} WHERE {where} AND id <= %s ORDER BY id",
+                    (*params, last_id)
+                ).decode()
+                if export_format == 'csv':
+                    header_option = 'true' if after == 0 else 'false'
+                    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER {header_option})", buffer)
+                else:
+                    cur.copy_expert(f"COPY (SELECT row_to_json(r) FROM ({query}) r) TO STDOUT WITH ({NDJSON_COPY_OPTIONS})", buffer)
+    
+    next_cursor = str(last_id) if rows == limit else ''
+    return text_response(200, buffer.getvalue(), TRANSFER_FORMATS[export_format], {
+        'X-Next-Cursor': next_cursor,
+        'X-Row-Count': str(rows)
+    })
+
+IMPORT_STAGES = {
+    'users': """CREATE TEMP TABLE import_stage (
+                    email TEXT, username TEXT, energy INTEGER, is_infinite_energy BOOLEAN, password_hash TEXT
+                ) ON COMMIT DROP""",
+    'energy': """CREATE TEMP TABLE import_stage (
+                     user_id INTEGER, email TEXT, amount INTEGER, transaction_type VARCHAR(50), description TEXT
+                 ) ON COMMIT DROP"""
+}
+IMPORT_COLUMNS = {
+    'users': ('email', 'username', 'energy', 'is_infinite_energy', 'password_hash'),
+    'energy': ('user_id', 'email', 'amount', 'transaction_type', 'description')
+}
+
+# New accounts only: existing emails and usernames are left untouched. Imported hashes must be in a format
+# passwords.py verifies; anything else becomes an unusable '!' so the account cannot be logged into
+MERGE_USERS = """
+    WITH merged AS (
+        INSERT INTO users (email, username, password_hash, energy, is_infinite_energy)
+        SELECT DISTINCT ON (lower(trim(email)))
+               lower(trim(email)), trim(username),
+               CASE WHEN password_hash ~ '^(scrypt\\$.+|[0-9a-f]{64})$' THEN password_hash ELSE '!' END,
+               GREATEST(0, COALESCE(energy, 100)), COALESCE(is_infinite_energy, FALSE)
+        FROM import_stage
+        WHERE trim(email) <> '' AND trim(username) <> ''
+        ORDER BY lower(trim(email))
+        ON CONFLICT DO NOTHING
+        RETURNING id, energy
+    ),
+    opening AS (
+        INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+        SELECT id, energy, 'import_opening', 'Imported balance'
+        FROM merged
+        WHERE energy <> 0
+    )
+    SELECT COUNT(*) AS applied FROM merged"""
+
+# Same rules as bulk_update_energy: the net amount per user is applied once, every input row gets a ledger row,
+# users are locked in id order, infinite-energy users are skipped and balances are clamped to the INTEGER range.
+# Staged amounts outside that range fail the COPY itself with a DataError, which import_rows reports as a 400
+MERGE_ENERGY = """
+    WITH input AS (
+        SELECT COALESCE(s.user_id, u.id) AS user_id, lower(trim(s.email)) AS email, s.amount,
+               COALESCE(NULLIF(s.transaction_type, ''), 'admin_import') AS transaction_type,
+               COALESCE(s.description, 'Admin import: ' || s.amount) AS description
+        FROM import_stage s
+        LEFT JOIN users u ON s.user_id IS NULL AND u.email = lower(trim(s.email))
+        WHERE s.amount IS NOT NULL
+    ),
+    per_user AS (
+        SELECT user_id, SUM(amount::bigint) AS amount FROM input WHERE user_id IS NOT NULL GROUP BY user_id
+    ),
+    locked AS (
+        SELECT id, is_infinite_energy FROM users
+        WHERE id IN (SELECT user_id FROM per_user)
+        ORDER BY id
+        FOR UPDATE
+    ),
+    updated AS (
+        UPDATE users u SET energy = LEAST(2147483647, GREATEST(0, u.energy + p.amount))::int
+        FROM per_user p
+        JOIN locked l ON l.id = p.user_id
+        WHERE u.id = p.user_id AND NOT l.is_infinite_energy
+        RETURNING u.id
+    ),
+    ledger AS (
+        INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+        SELECT i.user_id, i.amount, i.transaction_type, i.description
+        FROM input i
+        JOIN updated up ON up.id = i.user_id
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM ledger) AS applied,
+           (SELECT COUNT(*) FROM locked WHERE is_infinite_energy) AS skipped_infinite_energy,
+           -- Distinct users like the count above: an unknown id or email repeated over many rows is one user
+           (SELECT COUNT(DISTINCT COALESCE(user_id::text, 'email:' || email)) FROM input
+            WHERE user_id IS NULL OR user_id NOT IN (SELECT id FROM locked)) AS not_found"""
+
+def import_rows(data: Dict[str, Any]) -> Dict[str, Any]:
+    kind = data.get('kind')
+    import_format = data.get('format', 'csv')
+    rows = data.get('data')
+    
+    if kind not in IMPORT_STAGES or import_format not in TRANSFER_FORMATS:
+        return json_response(400, {
+            'error': f"kind must be one of {', '.join(IMPORT_STAGES)} and format one of {', '.join(TRANSFER_FORMATS)}"
+        })
+    if not isinstance(rows, str) or not rows.strip():
+        return json_response(400, {'error': 'data must be a non-empty CSV or NDJSON string'})
+    
+    if import_format == 'csv':
+        # The header row names the columns, in any order and any subset
+        columns = [c.strip().strip('"') for c in rows.split('\n', 1)[0].split(',')]
+        unknown = [c for c in columns if c not in IMPORT_COLUMNS[kind]]
+        if unknown:
+            return json_response(400, {'error': f"Unknown columns: {', '.join(unknown)}"})
+    
+    try:
+        with get_db_connection() as conn:
+            with dict_cursor(conn) as cur:
+                cur.execute(IMPORT_STAGES[kind])
+                if import_format == 'csv':
+                    cur.copy_expert(
+                        f"COPY import_stage ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+                        io.StringIO(rows)
+                    )
+                else:
+                    cur.execute("CREATE TEMP TABLE import_lines (line JSONB) ON COMMIT DROP")
+                    cur.copy_expert(f"COPY import_lines FROM STDIN WITH ({NDJSON_COPY_OPTIONS})", io.StringIO(rows))
+                    cur.execute("""INSERT INTO import_stage
+                                   SELECT r.* FROM import_lines, jsonb_populate_record(NULL::import_stage, line) r""")
+                
+                cur.execute("SELECT COUNT(*) AS staged FROM import_stage")
+                staged = cur.fetchone()['staged']
+                if staged > IMPORT_MAX_ROWS:
+                    conn.rollback()
+                    return json_response(400, {'error': f'At most {IMPORT_MAX_ROWS} rows per import'})
+                
+                cur.execute(MERGE_USERS if kind == 'users' else MERGE_ENERGY)
+                result = cur.fetchone()
+                conn.commit()
+    except (driver().DataError, driver().IntegrityError) as e:
+        return json_response(400, {'error': str(e).strip()})
+    
+    response = {'success': True, 'rows': staged, 'applied': result['applied']}
+    if kind == 'users':
+        response['skipped'] = staged - result['applied']
+    else:
+        # applied counts ledger rows, the skipped counts count users
+        response['skippedInfiniteEnergyUsers'] = result['skipped_infinite_energy']
+        response['notFoundUsers'] = result['not_found']
+    return json_response(200, response)
+
+def get_cache_stats() -> Dict[str, Any]:
+    return json_response(200, {'sessionCache': session_cache.stats(), 'routing': routing_stats})
+
+def get_timing_stats() -> Dict[str, Any]:
+    return json_response(200, {'timing': snapshot()})
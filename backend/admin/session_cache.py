@@ -0,0 +1,104 @@
+"""
+Кеш проверки сессионных токенов в памяти процесса: TTL + вытеснение LRU.
+Ключ — SHA-256 от токена, сам токен не хранится. Настройки: SESSION_CACHE_TTL, SESSION_CACHE_SIZE.
+Кеш живёт в одном экземпляре функции, поэтому TTL — верхняя граница устаревания для остальных экземпляров.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '30'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '1024'))
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionCache:
+    def __init__(self, ttl: float = SESSION_CACHE_TTL, max_size: int = SESSION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # digest -> (deadline, user_id, value)
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _drop(self, digest: str) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        digests = self._by_user.get(entry[1])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[entry[1]]
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        digest = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(digest)
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.counters['hits'] += 1
+            return entry[2]
+
+    def put(self, token: str, user_id: Any, value: Dict[str, Any],
+            expires_at: Optional[datetime] = None) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, (expires_at - datetime.now()).total_seconds())
+            if ttl <= 0:
+                return
+        digest = token_digest(token)
+        with self._lock:
+            self._drop(digest)
+            self._entries[digest] = (time.monotonic() + ttl, str(user_id), value)
+            self._by_user.setdefault(str(user_id), set()).add(digest)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.counters['evictions'] += 1
+
+    def invalidate_token(self, token: str) -> None:
+        digest = token_digest(token)
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+                self.counters['invalidations'] += 1
+
+    def invalidate_user(self, user_id: Any) -> None:
+        with self._lock:
+            for digest in list(self._by_user.get(str(user_id), ())):
+                self._drop(digest)
+                self.counters['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'ttl': self.ttl,
+                'hitRatio': round(self.counters['hits'] / lookups, 4) if lookups else 0.0
+            }
+
+session_cache = SessionCache()
@@ -0,0 +1,178 @@
+"""
+Замер фаз запроса: получение соединения, каждый execute/fetch, сериализация ответа.
+Результат уходит в заголовок Server-Timing, в одну JSON-строку лога на запрос и в скользящие гистограммы по action.
+Настройки: TIMING_HEADER, TIMING_LOG (1/0), TIMING_WINDOW (секунды окна гистограмм), TIMING_MAX_PHASES.
+Вне запроса record() ничего не делает, поэтому db.py и responses.py вызывают его без проверок.
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional
+
+TIMING_HEADER = os.environ.get('TIMING_HEADER', '1') == '1'
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') == '1'
+TIMING_WINDOW = float(os.environ.get('TIMING_WINDOW', '300'))
+TIMING_MAX_PHASES = int(os.environ.get('TIMING_MAX_PHASES', '24'))
+WINDOW_SLOTS = 10
+# Action names come from request bodies, so the number of histograms is capped
+MAX_ACTIONS = 32
+
+# Upper bucket bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+PHASE_KINDS = ('connect', 'sql', 'fetch', 'serialize', 'gzip')
+
+class RequestTiming:
+    __slots__ = ('started', 'action', 'phases', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.action = ''
+        self.phases: Dict[str, float] = {}
+        self.statements = 0
+
+    def add(self, name: str, seconds: float) -> None:
+        if name not in self.phases and len(self.phases) >= TIMING_MAX_PHASES:
+            name = 'other'
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+_current: contextvars.ContextVar = contextvars.ContextVar('request_timing', default=None)
+
+def record(name: str, seconds: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+def record_query(seconds: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.statements += 1
+        timing.add(f'sql{timing.statements}', seconds)
+
+def record_fetch(seconds: float) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.add(f'fetch{timing.statements}', seconds)
+
+def set_action(action: str) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.action = action
+
+class RollingHistogram:
+    def __init__(self, window: float = TIMING_WINDOW, slots: int = WINDOW_SLOTS):
+        self.slot_seconds = window / slots
+        self._slots: List[Optional[Dict[str, Any]]] = [None] * slots
+
+    def _slot(self, now: float) -> Dict[str, Any]:
+        epoch = int(now // self.slot_seconds)
+        index = epoch % len(self._slots)
+        slot = self._slots[index]
+        if slot is None or slot['epoch'] != epoch:
+            slot = {'epoch': epoch, 'buckets': [0] * (len(BUCKETS_MS) + 1), 'count': 0, 'errors': 0,
+                    'total': 0.0, 'phases': dict.fromkeys(PHASE_KINDS, 0.0)}
+            self._slots[index] = slot
+        return slot
+
+    def add(self, now: float, total_ms: float, error: bool, phases: Dict[str, float]) -> None:
+        slot = self._slot(now)
+        slot['buckets'][bisect_left(BUCKETS_MS, total_ms)] += 1
+        slot['count'] += 1
+        slot['errors'] += error
+        slot['total'] += total_ms
+        for name, seconds in phases.items():
+            kind = name.rstrip('0123456789')
+            if kind in slot['phases']:
+                slot['phases'][kind] += seconds * 1000
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        oldest = int(now // self.slot_seconds) - len(self._slots) + 1
+        live = [s for s in self._slots if s is not None and s['epoch'] >= oldest]
+        count = sum(s['count'] for s in live)
+        buckets = [sum(s['buckets'][i] for s in live) for i in range(len(BUCKETS_MS) + 1)]
+        result = {
+            'count': count,
+            'errors': sum(s['errors'] for s in live),
+            'meanMs': round(sum(s['total'] for s in live) / count, 3) if count else 0.0,
+            'buckets': {(f'le{bound}' if i < len(BUCKETS_MS) else 'inf'): n
+                        for i, (bound, n) in enumerate(zip(BUCKETS_MS + (None,), buckets)) if n},
+            'phaseMeanMs': {kind: round(sum(s['phases'][kind] for s in live) / count, 3) if count else 0.0
+                            for kind in PHASE_KINDS}
+        }
+        for pct in (50, 95, 99):
+            result[f'p{pct}Ms'] = _bucket_percentile(buckets, count, pct)
+        return result
+
+def _bucket_percentile(buckets: List[int], count: int, pct: int) -> Optional[float]:
+    if not count:
+        return None
+    rank = pct / 100 * count
+    seen = 0
+    for bound, n in zip(BUCKETS_MS, buckets):
+        seen += n
+        if seen >= rank:
+            return float(bound)
+    return None
+
+_histograms: Dict[str, RollingHistogram] = {}
+_histograms_lock = threading.Lock()
+_started_at = time.time()
+_cold = True
+
+def _observe(action: str, total_ms: float, error: bool, phases: Dict[str, float]) -> None:
+    now = time.time()
+    with _histograms_lock:
+        histogram = _histograms.get(action)
+        if histogram is None:
+            if len(_histograms) >= MAX_ACTIONS:
+                action = 'other'
+            histogram = _histograms.get(action) or _histograms.setdefault(action, RollingHistogram())
+        histogram.add(now, total_ms, error, phases)
+
+def snapshot() -> Dict[str, Any]:
+    now = time.time()
+    with _histograms_lock:
+        actions = {action: histogram.snapshot(now) for action, histogram in _histograms.items()}
+    return {'windowSeconds': TIMING_WINDOW, 'uptimeSeconds': round(now - _started_at, 1), 'actions': actions}
+
+def instrumented(function_name: str) -> Callable:
+    def decorate(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            global _cold
+            if event.get('httpMethod') == 'OPTIONS':
+                return handler(event, context)
+            timing = RequestTiming()
+            token = _current.set(timing)
+            try:
+                response = handler(event, context)
+            finally:
+                _current.reset(token)
+            total_ms = (time.perf_counter() - timing.started) * 1000
+            status = response.get('statusCode', 0)
+            action = timing.action or 'unknown'
+            _observe(action, total_ms, status >= 500, timing.phases)
+            if TIMING_HEADER:
+                metrics = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in timing.phases.items()]
+                metrics.append(f'total;dur={total_ms:.3f}')
+                response['headers'] = {
+                    **response.get('headers', {}),
+                    'Server-Timing': ', '.join(metrics),
+                    # Lets the browser expose the metrics to the cross-origin frontend
+                    'Timing-Allow-Origin': '*'
+                }
+            if TIMING_LOG:
+                line = json.dumps({
+                    'type': 'request', 'function': function_name, 'action': action, 'status': status,
+                    'cold': _cold, 'totalMs': round(total_ms, 3),
+                    'phases': {name: round(seconds * 1000, 3) for name, seconds in timing.phases.items()}
+                }, separators=(',', ':'))
+                sys.stdout.write(line + '\n')
+            _cold = False
+            return response
+        return wrapper
+    return decorate
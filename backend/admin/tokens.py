@@ -0,0 +1,123 @@
+"""
+Подписанные (HMAC-SHA256) сессионные токены и набор отозванных сессий.
+Формат: s1.<user_id>.<expires_unix>.<session_id>.<signature>. Включается переменной SESSION_SIGNING_KEY;
+без неё выдаются прежние непрозрачные токены. SESSION_SIGNING_KEY_PREVIOUS принимается при проверке (ротация ключа).
+Отзыв: таблица revoked_sessions, которая подгружается в память пачками раз в REVOCATION_REFRESH секунд.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+TOKEN_PREFIX = 's1'
+SIGNING_KEY = os.environ.get('SESSION_SIGNING_KEY', '')
+PREVIOUS_SIGNING_KEY = os.environ.get('SESSION_SIGNING_KEY_PREVIOUS', '')
+REVOCATION_REFRESH = float(os.environ.get('REVOCATION_REFRESH', '5'))
+
+def signing_enabled() -> bool:
+    return bool(SIGNING_KEY)
+
+def is_signed_token(token: str) -> bool:
+    return token.startswith(TOKEN_PREFIX + '.')
+
+def _sign(key: str, payload: str) -> str:
+    digest = hmac.new(key.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+def generate_token(user_id: Optional[int] = None, expires_at: Optional[datetime] = None) -> str:
+    if not signing_enabled() or user_id is None or expires_at is None:
+        return secrets.token_urlsafe(32)
+    session_id = secrets.token_urlsafe(16)
+    payload = f'{TOKEN_PREFIX}.{int(user_id)}.{int(expires_at.timestamp())}.{session_id}'
+    return f'{payload}.{_sign(SIGNING_KEY, payload)}'
+
+def parse_token(token: str, check_expiry: bool = True) -> Optional[Dict[str, Any]]:
+    parts = token.split('.')
+    if len(parts) != 5 or parts[0] != TOKEN_PREFIX:
+        return None
+    payload, signature = token.rsplit('.', 1)
+    keys = [k for k in (SIGNING_KEY, PREVIOUS_SIGNING_KEY) if k]
+    if not any(hmac.compare_digest(_sign(key, payload), signature) for key in keys):
+        return None
+    try:
+        user_id, expires = int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+    if check_expiry and expires <= time.time():
+        return None
+    return {'userId': user_id, 'expiresAt': expires, 'sessionId': parts[3]}
+
+class RevocationSet:
+    def __init__(self, refresh_interval: float = REVOCATION_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        # session_id -> expires (unix time)
+        self._revoked: Dict[str, float] = {}
+        self._watermark: Optional[datetime] = None
+        self._next_refresh = 0.0
+
+    def _prune(self, now: float) -> None:
+        for session_id in [sid for sid, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[session_id]
+
+    def refresh(self, conn) -> None:
+        with conn.cursor() as cur:
+            if self._watermark is None:
+                cur.execute(
+                    """SELECT session_id, expires_at, revoked_at FROM revoked_sessions
+                       WHERE expires_at > CURRENT_TIMESTAMP"""
+                )
+            else:
+                cur.execute(
+                    """SELECT session_id, expires_at, revoked_at FROM revoked_sessions
+                       WHERE revoked_at >= %s - INTERVAL '30 seconds'
+                         AND expires_at > CURRENT_TIMESTAMP""",
+                    (self._watermark,)
+                )
+            rows: List[tuple] = cur.fetchall()
+        conn.rollback()
+        now = time.time()
+        with self._lock:
+            for session_id, expires_at, revoked_at in rows:
+                self._revoked[session_id] = expires_at.timestamp()
+                if self._watermark is None or revoked_at > self._watermark:
+                    self._watermark = revoked_at
+            self._prune(now)
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def needs_refresh(self) -> bool:
+        return time.monotonic() >= self._next_refresh
+
+    def add(self, session_id: str, expires: float) -> None:
+        with self._lock:
+            self._revoked[session_id] = expires
+
+    def is_revoked(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._revoked
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+revocations = RevocationSet()
+
+def revoke(conn, claims: Dict[str, Any]) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO revoked_sessions (session_id, expires_at)
+               VALUES (%s, to_timestamp(%s)::timestamp)
+               ON CONFLICT (session_id) DO NOTHING""",
+            (claims['sessionId'], claims['expiresAt'])
+        )
+    revocations.add(claims['sessionId'], claims['expiresAt'])
+
+def is_revoked(claims: Dict[str, Any], get_connection) -> bool:
+    if revocations.needs_refresh():
+        with get_connection() as conn:
+            revocations.refresh(conn)
+    return revocations.is_revoked(claims['sessionId'])
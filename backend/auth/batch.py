@@ -0,0 +1,64 @@
+"""
+Пакетные запросы: тело — массив объектов {action, ...} или {"batch": [...], "snapshot": true}.
+Проверка токена выполняется один раз вызывающей функцией, все действия идут на одном соединении из пула,
+при snapshot — в одном снимке REPEATABLE READ READ ONLY (разрешены только действия на чтение).
+Ответ — массив [{action, status, body}] в порядке запроса; заголовки действия (X-Next-Cursor, Content-Type) приходят
+в поле headers, ETag дополнительно в поле etag (условный элемент передаёт его обратно в ifNoneMatch и получает status 304
+без тела). Настройка: BATCH_MAX_ITEMS.
+"""
+import os
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+from db import driver, pinned_connection
+from responses import collecting_payloads, json_response
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '20'))
+
+def parse_batch(body: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(body, list):
+        return {'items': body, 'snapshot': False}
+    if isinstance(body, dict) and 'action' not in body and isinstance(body.get('batch'), list):
+        return {'items': body['batch'], 'snapshot': bool(body.get('snapshot'))}
+    return None
+
+def run_batch(batch: Dict[str, Any], dispatch: Callable[[Dict[str, Any]], Dict[str, Any]],
+              read_actions: FrozenSet[str], defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    items: List[Any] = batch['items']
+    snapshot = batch['snapshot']
+
+    if not items or len(items) > BATCH_MAX_ITEMS:
+        return json_response(400, {'error': f'Batch must contain between 1 and {BATCH_MAX_ITEMS} actions'})
+
+    results = []
+    with pinned_connection(snapshot) as conn, collecting_payloads():
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get('action'), str):
+                results.append({'action': None, 'status': 400, 'body': {'error': 'Each batch item must be an object with an action'}})
+                continue
+            action = item['action']
+            if snapshot and action not in read_actions:
+                results.append({'action': action, 'status': 400, 'body': {'error': 'Action is not allowed in a read-only snapshot'}})
+                continue
+
+            if snapshot:
+                # A failing item must not abort the snapshot the remaining items read from
+                with conn.cursor() as cur:
+                    cur.execute(f'SAVEPOINT batch_item_{index}')
+            response = dispatch({**(defaults or {}), **item})
+            if snapshot:
+                with conn.cursor() as cur:
+                    if conn.get_transaction_status() == driver().extensions.TRANSACTION_STATUS_INERROR:
+                        cur.execute(f'ROLLBACK TO SAVEPOINT batch_item_{index}')
+                    cur.execute(f'RELEASE SAVEPOINT batch_item_{index}')
+            elif conn.get_transaction_status() != driver().extensions.TRANSACTION_STATUS_IDLE:
+                # Same clean-up the pool does when a connection is returned
+                conn.rollback()
+
+            result = {'action': action, 'status': response['statusCode'], 'body': response['payload']}
+            if response['headers']:
+                # Paging and content headers (X-Next-Cursor, Content-Type) travel with the item
+                result['headers'] = response['headers']
+            if 'ETag' in response['headers']:
+                result['etag'] = response['headers']['ETag']
+            results.append(result)
+
+    return json_response(200, results)
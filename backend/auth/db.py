@@ -0,0 +1,497 @@
+"""
+Пул соединений с PostgreSQL, который переживает тёплые вызовы функции.
+Настройки: DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_AGE, DB_POOL_PING_AFTER, DB_POOL_TIMEOUT.
+Драйвер psycopg2 импортируется при первом обращении к базе, а не при холодном старте функции.
+Горячие запросы регистрируются через prepare_statement() и выполняются по имени (PREPARE/EXECUTE) — один разбор
+и план на соединение; DB_PREPARED_STATEMENTS=0 отключает это (например, за pgbouncer в режиме transaction).
+pinned_connection() закрепляет одно соединение за пакетом действий (batch.py): get_db_connection() внутри него
+отдаёт это же соединение, по желанию — в одном снимке REPEATABLE READ READ ONLY.
+Если рядом лежит timing.py, время получения соединения и каждого execute/fetch попадает в замер запроса.
+Реплики: DATABASE_URL_REPLICA (несколько — через запятую) получают чтения get_db_connection(read_only=True)
+и пакеты-снимки по кругу. Реплика, которая не отвечает или отстаёт больше DB_REPLICA_MAX_LAG секунд
+(проверяется не чаще DB_REPLICA_LAG_CHECK), пропускается DB_REPLICA_RETRY_AFTER секунд — чтение идёт на основную базу.
+Если у реплики нет свободного соединения в пуле, чтение сразу идёт на основную базу, а реплика не пропускается.
+Свои записи: note_write() отправляет чтения того же автора (set_writer() — id пользователя запроса) на основную базу
+на DB_READ_YOUR_WRITES секунд; чтения остальных вызывающих по-прежнему идут на реплики.
+а read_your_writes() повторяет на основной базе чтение, не нашедшее на реплике только что созданную строку.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+try:
+    from timing import record, record_fetch, record_query
+except ImportError:
+    record = record_fetch = record_query = None
+
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_URL_REPLICA', '').split(',') if url.strip()]
+REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK = float(os.environ.get('DB_REPLICA_LAG_CHECK', '5'))
+REPLICA_RETRY_AFTER = float(os.environ.get('DB_REPLICA_RETRY_AFTER', '30'))
+# A replica host that is down must fail fast, not after the OS TCP timeout
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+READ_YOUR_WRITES = float(os.environ.get('DB_READ_YOUR_WRITES', '10'))
+# Writers remembered at once; beyond that the oldest writes are forgotten first
+READ_YOUR_WRITES_MAX_WRITERS = 10000
+
+_driver = None
+
+def driver():
+    global _driver
+    if _driver is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.extras
+        _driver = psycopg2
+    return _driver
+
+def connection_errors() -> tuple:
+    return (driver().OperationalError, driver().InterfaceError)
+
+_timed_cursor = None
+
+def _timed_cursor_class():
+    global _timed_cursor
+    if _timed_cursor is None:
+        class TimedDictCursor(driver().extras.RealDictCursor):
+            def execute(self, query, vars=None):
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    record_query(time.perf_counter() - started)
+
+            def fetchone(self):
+                started = time.perf_counter()
+                try:
+                    return super().fetchone()
+                finally:
+                    record_fetch(time.perf_counter() - started)
+
+            def fetchmany(self, size=None):
+                started = time.perf_counter()
+                try:
+                    return super().fetchmany(size)
+                finally:
+                    record_fetch(time.perf_counter() - started)
+
+            def fetchall(self):
+                started = time.perf_counter()
+                try:
+                    return super().fetchall()
+                finally:
+                    record_fetch(time.perf_counter() - started)
+
+        _timed_cursor = TimedDictCursor
+    return _timed_cursor
+
+def dict_cursor(conn):
+    if record_query is None:
+        return conn.cursor(cursor_factory=driver().extras.RealDictCursor)
+    return conn.cursor(cursor_factory=_timed_cursor_class())
+
+class PoolTimeout(Exception):
+    pass
+
+# Names of statements PREPAREd on each live connection of any pool, dropped together with the connection
+_prepared: Dict[int, Set[str]] = {}
+
+def prepared_names(conn) -> Set[str]:
+    return _prepared.setdefault(id(conn), set())
+
+class ConnectionPool:
+    def __init__(self, dsn: str, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 max_age: float = POOL_MAX_AGE, ping_after: float = POOL_PING_AFTER,
+                 timeout: float = POOL_TIMEOUT, connect_timeout: Optional[int] = None):
+        self.dsn = dsn
+        self.connect_timeout = connect_timeout
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        # (connection, created_at, last_used_at)
+        self._idle: List[Tuple[Any, float, float]] = []
+        self._born: Dict[int, float] = {}
+        self._size = 0
+        self.stats = {'connects': 0, 'reuses': 0, 'reconnects': 0, 'discarded': 0}
+
+    def _connect(self):
+        if self.connect_timeout:
+            conn = driver().connect(self.dsn, connect_timeout=self.connect_timeout)
+        else:
+            conn = driver().connect(self.dsn)
+        self._born[id(conn)] = time.monotonic()
+        self.stats['connects'] += 1
+        return conn
+
+    def _discard(self, conn) -> None:
+        self._born.pop(id(conn), None)
+        _prepared.pop(id(conn), None)
+        self.stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.max_age > 0 and now - created_at > self.max_age
+
+    def _is_alive(self, conn, last_used_at: float, now: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == driver().extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if now - last_used_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except connection_errors():
+            return False
+
+    def warm(self) -> None:
+        with self._cond:
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        for created in range(missing):
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= missing - created
+                    self._cond.notify_all()
+                raise
+            now = time.monotonic()
+            with self._cond:
+                self._idle.append((conn, now, now))
+                self._cond.notify()
+
+    def getconn(self, timeout: Optional[float] = None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            with self._cond:
+                candidate = self._idle.pop() if self._idle else None
+                if candidate is None and self._size < self.max_size:
+                    self._size += 1
+                    reserve = True
+                else:
+                    reserve = False
+                if candidate is None and not reserve:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout('No database connection available')
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is not None:
+                conn, created_at, last_used_at = candidate
+                now = time.monotonic()
+                if not self._is_expired(created_at, now) and self._is_alive(conn, last_used_at, now):
+                    self.stats['reuses'] += 1
+                    return conn
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+
+            try:
+                return self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+    def putconn(self, conn, broken: bool = False) -> None:
+        now = time.monotonic()
+        created_at = self._born.get(id(conn), now)
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != driver().extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except connection_errors():
+                broken = True
+        keep = not broken and not conn.closed and not self._is_expired(created_at, now)
+        if not keep:
+            self._discard(conn)
+        with self._cond:
+            if keep:
+                self._idle.append((conn, created_at, now))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        started = time.perf_counter()
+        conn = self.getconn(timeout)
+        if record is not None:
+            record('connect', time.perf_counter() - started)
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = isinstance(e, connection_errors())
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def owns(self, conn) -> bool:
+        return id(conn) in self._born
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+class PinnedConnection:
+    # Stands in for a pooled connection inside a batch. In a snapshot, commit/rollback from actions are
+    # ignored so the snapshot spans the whole batch; the batch rolls it back at the end.
+    def __init__(self, conn, snapshot: bool):
+        self._conn = conn
+        self.snapshot = snapshot
+
+    def commit(self) -> None:
+        if not self.snapshot:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        if not self.snapshot:
+            self._conn.rollback()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+_pinned: contextvars.ContextVar = contextvars.ContextVar('pinned_connection', default=None)
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                started = time.perf_counter()
+                pool = ConnectionPool(os.environ['DATABASE_URL'])
+                pool.warm()
+                _pool = pool
+                if record is not None:
+                    record('pool_init', time.perf_counter() - started)
+    return _pool
+
+class Replica:
+    def __init__(self, dsn: str):
+        self.pool = ConnectionPool(dsn, min_size=0, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+        self.skip_until = 0.0
+        self.lag_checked_at = 0.0
+        self.lag: Optional[float] = None
+
+_replicas: Optional[List[Replica]] = None
+_replica_lock = threading.Lock()
+_next_replica = 0
+# writer -> time of its last write, oldest first
+_last_writes: Dict[Any, float] = {}
+_writer: contextvars.ContextVar = contextvars.ContextVar('db_writer', default=None)
+_on_replica: contextvars.ContextVar = contextvars.ContextVar('read_on_replica', default=False)
+routing_stats = {
+    'replicaReads': 0, 'primaryReads': 0, 'replicaDown': 0, 'replicaLagging': 0, 'replicaBusy': 0, 'primaryRetries': 0
+}
+
+def get_replicas() -> List[Replica]:
+    global _replicas
+    if _replicas is None:
+        with _replica_lock:
+            if _replicas is None:
+                # Replica pools open connections on first use; a replica that is down must not fail the cold start
+                _replicas = [Replica(url) for url in REPLICA_URLS]
+    return _replicas
+
+# Seconds the replica is behind; WAL received but not yet replayed counts, an idle but caught-up replica is 0
+REPLICA_LAG_SQL = """
+    SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END AS lag"""
+
+def _replica_usable(replica: Replica, conn) -> bool:
+    now = time.monotonic()
+    if now - replica.lag_checked_at >= REPLICA_LAG_CHECK:
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_LAG_SQL)
+            replica.lag = float(cur.fetchone()[0])
+        conn.rollback()
+        replica.lag_checked_at = now
+    if replica.lag is not None and replica.lag > REPLICA_MAX_LAG:
+        replica.skip_until = now + REPLICA_RETRY_AFTER
+        routing_stats['replicaLagging'] += 1
+        return False
+    return True
+
+def _replica_conn() -> Optional[Tuple[Replica, Any]]:
+    global _next_replica
+    replicas = get_replicas()
+    now = time.monotonic()
+    for _ in range(len(replicas)):
+        with _replica_lock:
+            replica = replicas[_next_replica % len(replicas)]
+            _next_replica += 1
+        if replica.skip_until > now:
+            continue
+        try:
+            # No waiting for a saturated replica pool: the primary is right there
+            conn = replica.pool.getconn(timeout=0)
+        except PoolTimeout:
+            # Busy is not down, so the replica stays in the rotation
+            routing_stats['replicaBusy'] += 1
+            continue
+        except connection_errors():
+            replica.skip_until = now + REPLICA_RETRY_AFTER
+            routing_stats['replicaDown'] += 1
+            continue
+        try:
+            usable = _replica_usable(replica, conn)
+        except connection_errors():
+            replica.pool.putconn(conn, broken=True)
+            replica.skip_until = now + REPLICA_RETRY_AFTER
+            routing_stats['replicaDown'] += 1
+            continue
+        if usable:
+            return replica, conn
+        replica.pool.putconn(conn)
+    return None
+
+@contextmanager
+def _read_connection() -> Iterator[Any]:
+    picked = None if _wrote_recently() else _replica_conn()
+    _on_replica.set(picked is not None)
+    if picked is None:
+        routing_stats['primaryReads'] += 1
+        with get_pool().connection() as conn:
+            yield conn
+        return
+    replica, conn = picked
+    routing_stats['replicaReads'] += 1
+    broken = False
+    try:
+        yield conn
+    except Exception as e:
+        broken = isinstance(e, connection_errors())
+        if broken:
+            replica.skip_until = time.monotonic() + REPLICA_RETRY_AFTER
+            routing_stats['replicaDown'] += 1
+        raise
+    finally:
+        replica.pool.putconn(conn, broken=broken)
+
+def get_db_connection(read_only: bool = False):
+    pinned = _pinned.get()
+    if pinned is not None:
+        return nullcontext(pinned)
+    if read_only and REPLICA_URLS:
+        return _read_connection()
+    return get_pool().connection()
+
+def is_replica(conn) -> bool:
+    conn = getattr(conn, '_conn', conn)
+    return any(replica.pool.owns(conn) for replica in (_replicas or ()))
+
+def set_writer(writer: Any) -> None:
+    _writer.set(writer)
+
+def note_write() -> None:
+    writer = _writer.get()
+    now = time.monotonic()
+    with _replica_lock:
+        _last_writes.pop(writer, None)
+        _last_writes[writer] = now
+        while len(_last_writes) > READ_YOUR_WRITES_MAX_WRITERS:
+            del _last_writes[next(iter(_last_writes))]
+
+def _wrote_recently() -> bool:
+    written = _last_writes.get(_writer.get())
+    return written is not None and time.monotonic() - written < READ_YOUR_WRITES
+
+def read_your_writes(read: Callable[[bool], Any]) -> Any:
+    # read(read_only) returns None when the row is missing; a miss on a replica may only mean
+    # the row was written a moment ago (a session right after login or register), so the primary gets asked too
+    _on_replica.set(False)
+    result = read(True)
+    if result is None and _on_replica.get():
+        routing_stats['primaryRetries'] += 1
+        result = read(False)
+    return result
+
+@contextmanager
+def pinned_connection(snapshot: bool = False) -> Iterator[PinnedConnection]:
+    # A read-only snapshot batch is a read like any other and may run on a replica
+    with (_read_connection() if snapshot and REPLICA_URLS else get_pool().connection()) as conn:
+        pinned = PinnedConnection(conn, snapshot)
+        token = _pinned.set(pinned)
+        try:
+            if snapshot:
+                with conn.cursor() as cur:
+                    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            yield pinned
+        finally:
+            _pinned.reset(token)
+
+def in_read_only_snapshot() -> bool:
+    pinned = _pinned.get()
+    return pinned is not None and pinned.snapshot
+
+# name -> (original %s query, PREPARE statement)
+_statements: Dict[str, Tuple[str, str]] = {}
+
+def prepare_statement(name: str, query: str) -> str:
+    parts = query.split('%s')
+    body = parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], start=1))
+    _statements[name] = (query, f'PREPARE {name} AS {body}')
+    return name
+
+def execute_prepared(cur, name: str, params: Sequence[Any] = ()) -> None:
+    query, prepare = _statements[name]
+    if not PREPARED_STATEMENTS:
+        cur.execute(query, params)
+        return
+    conn = cur.connection
+    names = prepared_names(conn)
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})" if params else f'EXECUTE {name}'
+    idle = conn.get_transaction_status() == driver().extensions.TRANSACTION_STATUS_IDLE
+    if name not in names:
+        _prepare(cur, name, prepare, names)
+    try:
+        cur.execute(execute, params)
+    except driver().Error as e:
+        # The server session lost the statement (reset by a proxy or a recycled backend).
+        # Re-prepare and retry only when nothing else in the transaction would be rolled back with it.
+        if e.pgcode != '26000' or not idle:
+            raise
+        conn.rollback()
+        names.clear()
+        _prepare(cur, name, prepare, names)
+        cur.execute(execute, params)
+
+def _prepare(cur, name: str, prepare: str, names: Set[str]) -> None:
+    conn = cur.connection
+    idle = conn.get_transaction_status() == driver().extensions.TRANSACTION_STATUS_IDLE
+    try:
+        cur.execute(prepare)
+    except driver().Error as e:
+        # Already prepared on this session but not tracked yet: usable as is
+        if e.pgcode != '42P05' or not idle:
+            raise
+        conn.rollback()
+    names.add(name)
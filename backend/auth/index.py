@@ -1,49 +1,127 @@
 """
 Система аутентификации с регистрацией, авторизацией и управлением сессиями.
 Обрабатывает: регистрацию новых пользователей (100 энергии), вход, выход, проверку токенов.
+При LAST_LOGIN_WRITE_BEHIND=1 last_login пишется отложенно пачками (write_behind.py), вход не трогает строку users.
+Вход и смена пароля ограничены по email и IP клиента (throttle.py): лишние попытки получают 429 до любой работы.
 """
 import json
+import math
 import os
-import hashlib
-import secrets
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import Dict, Any, List, Optional
+from db import dict_cursor, execute_prepared, get_db_connection, prepare_statement, read_your_writes, routing_stats
+from responses import begin_request, header, json_response, preflight_response
+from session_cache import session_cache
+from passwords import PasswordHasherBusy, hash_password, verify_password
+from tokens import generate_token, is_signed_token, parse_token, is_revoked, revoke, signing_enabled
+from timing import instrumented, set_action, snapshot
+from batch import parse_batch, run_batch
+from throttle import begin_attempts, buckets, throttle_attempt
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+LAST_LOGIN_WRITE_BEHIND = os.environ.get('LAST_LOGIN_WRITE_BEHIND', '0') == '1'
+# Off by default, so the module is not even compiled at cold start
+if LAST_LOGIN_WRITE_BEHIND:
+    from write_behind import last_login_buffer
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+# Hot statements, parsed and planned once per pooled connection
+USER_BY_EMAIL = prepare_statement('auth_user_by_email', """
+    SELECT id, email, username, energy, is_infinite_energy, is_admin, password_hash
+    FROM users WHERE email = %s""")
+USER_BY_ID = prepare_statement('auth_user_by_id', """
+    SELECT id, email, username, energy, is_infinite_energy, is_admin,
+           to_timestamp(%s)::timestamp AS expires_at
+    FROM users WHERE id = %s""")
+SESSION_USER = prepare_statement('auth_session_user', """
+    SELECT u.id, u.email, u.username, u.energy, u.is_infinite_energy, u.is_admin, s.expires_at
+    FROM sessions s
+    JOIN users u ON s.user_id = u.id
+    WHERE s.session_token = %s AND s.expires_at > CURRENT_TIMESTAMP""")
+# Registration and its session in one statement: a taken email or username inserts nothing and returns no row
+REGISTER_USER = prepare_statement('auth_register_user', """
+    WITH new_user AS (
+        INSERT INTO users (id, email, username, password_hash, energy, is_infinite_energy, is_admin)
+        VALUES (COALESCE(%s, nextval(pg_get_serial_sequence('users', 'id'))), %s, %s, %s, 100, FALSE, FALSE)
+        ON CONFLICT DO NOTHING
+        RETURNING id, email, username, energy, is_infinite_energy, is_admin
+    ), new_session AS (
+        INSERT INTO sessions (user_id, session_token, expires_at)
+        SELECT id, %s, %s FROM new_user
+    ), bonus AS (
+        -- The starting energy goes through the ledger too, so ledger_reconcile can account for it
+        INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+        SELECT id, energy, 'registration_bonus', 'Registration bonus' FROM new_user
+    )
+    SELECT * FROM new_user""")
+# last_login, an optional rehash (only if the hash is still the one verified) and the new session in one statement
+LOGIN_SESSION = prepare_statement('auth_login_session', """
+    WITH touched AS (
+        UPDATE users
+        SET last_login = CURRENT_TIMESTAMP,
+            password_hash = CASE WHEN %s::varchar IS NOT NULL AND password_hash = %s THEN %s ELSE password_hash END
+        WHERE id = %s
+        RETURNING id
+    )
+    INSERT INTO sessions (user_id, session_token, expires_at)
+    SELECT id, %s, %s FROM touched
+    RETURNING user_id""")
+# The same without the last_login write, for LAST_LOGIN_WRITE_BEHIND: users is only written when a rehash is due
+LOGIN_SESSION_DEFERRED = prepare_statement('auth_login_session_deferred', """
+    WITH rehashed AS (
+        UPDATE users SET password_hash = %s
+        WHERE %s::varchar IS NOT NULL AND id = %s AND password_hash = %s
+    )
+    INSERT INTO sessions (user_id, session_token, expires_at)
+    SELECT id, %s, %s FROM users WHERE id = %s
+    RETURNING user_id""")
 
-def generate_token() -> str:
-    return secrets.token_urlsafe(32)
+# Actions allowed in a read-only batch snapshot
+READ_ACTIONS = frozenset({'verify', 'cache_stats', 'timing_stats'})
 
-def cors_headers() -> Dict[str, str]:
-    return {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-        'Access-Control-Max-Age': '86400'
-    }
+USER_ID_BLOCK = int(os.environ.get('USER_ID_BLOCK', '16'))
+_reserved_ids: List[int] = []
+_reserved_lock = threading.Lock()
+
+def reserve_user_id(cur) -> int:
+    # Signed tokens embed the user id, so it is taken from the sequence before the insert, a block at a time
+    with _reserved_lock:
+        if not _reserved_ids:
+            cur.execute(
+                "SELECT nextval(pg_get_serial_sequence('users', 'id')) AS id FROM generate_series(1, %s)",
+                (USER_ID_BLOCK,)
+            )
+            _reserved_ids.extend(row['id'] for row in cur.fetchall())
+        return _reserved_ids.pop(0)
 
+@instrumented('auth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': cors_headers(),
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight_response()
+    
+    begin_request(event)
+    begin_attempts(event)
     
     try:
         body_data = json.loads(event.get('body', '{}'))
-        action = body_data.get('action', '')
+        batch = parse_batch(body_data)
+        if batch is not None:
+            set_action('batch')
+            # Items without their own token use the header one; after the first lookup it is a session cache hit
+            token = header(event, 'X-Auth-Token')
+            return run_batch(batch, dispatch, READ_ACTIONS, {'token': token} if token else None)
         
+        action = body_data.get('action', '')
+        set_action(action)
+        return dispatch(body_data)
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+def dispatch(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    action = body_data.get('action', '')
+    
+    try:
         if action == 'register':
             return register_user(body_data)
         elif action == 'login':
@@ -54,20 +132,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return verify_token(body_data)
         elif action == 'update_password':
             return update_password(body_data)
+        elif action == 'consume_energy':
+            return consume_energy(body_data)
+        elif action == 'cache_stats':
+            return get_cache_stats(body_data)
+        elif action == 'timing_stats':
+            return get_timing_stats(body_data)
         else:
-            return {
-                'statusCode': 400,
-                'headers': cors_headers(),
-                'body': json.dumps({'error': 'Invalid action'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'Invalid action'})
+    except PasswordHasherBusy:
+        return json_response(503, {'error': 'Server is busy, please retry'}, {'Retry-After': '1'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 def register_user(data: Dict[str, Any]) -> Dict[str, Any]:
     email = data.get('email', '').strip().lower()
@@ -75,208 +151,184 @@ def register_user(data: Dict[str, Any]) -> Dict[str, Any]:
     password = data.get('password', '')
     
     if not email or not username or not password:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'Email, username and password are required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Email, username and password are required'})
     
     if len(password) < 6:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'Password must be at least 6 characters'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT id FROM users WHERE email = %s OR username = %s",
-                (email, username)
-            )
-            if cur.fetchone():
-                return {
-                    'statusCode': 409,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'Email or username already exists'}),
-                    'isBase64Encoded': False
-                }
-            
-            password_hash = hash_password(password)
-            cur.execute(
-                """INSERT INTO users (email, username, password_hash, energy, is_infinite_energy, is_admin)
-                   VALUES (%s, %s, %s, 100, FALSE, FALSE)
-                   RETURNING id, email, username, energy, is_infinite_energy, is_admin""",
-                (email, username, password_hash)
-            )
+        return json_response(400, {'error': 'Password must be at least 6 characters'})
+    
+    password_hash = hash_password(password)
+    expires_at = datetime.now() + timedelta(days=30)
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
+            user_id = reserve_user_id(cur) if signing_enabled() else None
+            token = generate_token(user_id, expires_at)
+            execute_prepared(cur, REGISTER_USER, (user_id, email, username, password_hash, token, expires_at))
             user = cur.fetchone()
             conn.commit()
             
-            token = generate_token()
-            expires_at = datetime.now() + timedelta(days=30)
-            cur.execute(
-                "INSERT INTO sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)",
-                (user['id'], token, expires_at)
-            )
-            conn.commit()
+            if not user:
+                return json_response(409, {'error': 'Email or username already exists'})
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({
-                    'token': token,
-                    'user': {
-                        'id': user['id'],
-                        'email': user['email'],
-                        'username': user['username'],
-                        'energy': user['energy'],
-                        'isInfiniteEnergy': user['is_infinite_energy'],
-                        'isAdmin': user['is_admin']
-                    }
-                }),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            return json_response(200, {
+                'token': token,
+                'user': {
+                    'id': user['id'],
+                    'email': user['email'],
+                    'username': user['username'],
+                    'energy': user['energy'],
+                    'isInfiniteEnergy': user['is_infinite_energy'],
+                    'isAdmin': user['is_admin']
+                }
+            })
+
+def throttled_response(wait: float) -> Dict[str, Any]:
+    return json_response(429, {'error': 'Too many attempts, please retry later'}, {'Retry-After': str(math.ceil(wait))})
 
 def login_user(data: Dict[str, Any]) -> Dict[str, Any]:
     email = data.get('email', '').strip().lower()
     password = data.get('password', '')
     
     if not email or not password:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'Email and password are required'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            password_hash = hash_password(password)
-            cur.execute(
-                """SELECT id, email, username, energy, is_infinite_energy, is_admin
-                   FROM users WHERE email = %s AND password_hash = %s""",
-                (email, password_hash)
-            )
+        return json_response(400, {'error': 'Email and password are required'})
+    
+    wait = throttle_attempt(email, get_db_connection)
+    if wait:
+        return throttled_response(wait)
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
+            execute_prepared(cur, USER_BY_EMAIL, (email,))
             user = cur.fetchone()
-            
-            if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'Invalid email or password'}),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s", (user['id'],))
+    
+    valid, needs_rehash = verify_password(password, user['password_hash'] if user else None)
+    
+    if not valid:
+        return json_response(401, {'error': 'Invalid email or password'})
+    
+    new_hash = hash_password(password) if needs_rehash else None
+    
+    expires_at = datetime.now() + timedelta(days=30)
+    token = generate_token(user['id'], expires_at)
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
+            if LAST_LOGIN_WRITE_BEHIND:
+                execute_prepared(cur, LOGIN_SESSION_DEFERRED, (
+                    new_hash, new_hash, user['id'], user['password_hash'], token, expires_at, user['id']
+                ))
+            else:
+                execute_prepared(cur, LOGIN_SESSION, (
+                    new_hash, user['password_hash'], new_hash, user['id'], token, expires_at
+                ))
+            created = cur.fetchone()
             conn.commit()
             
-            token = generate_token()
-            expires_at = datetime.now() + timedelta(days=30)
-            cur.execute(
-                "INSERT INTO sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)",
-                (user['id'], token, expires_at)
-            )
-            conn.commit()
+            if not created:
+                return json_response(401, {'error': 'Invalid email or password'})
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({
-                    'token': token,
-                    'user': {
-                        'id': user['id'],
-                        'email': user['email'],
-                        'username': user['username'],
-                        'energy': user['energy'],
-                        'isInfiniteEnergy': user['is_infinite_energy'],
-                        'isAdmin': user['is_admin']
-                    }
-                }),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            if LAST_LOGIN_WRITE_BEHIND:
+                last_login_buffer.touch(user['id'])
+            
+            return json_response(200, {
+                'token': token,
+                'user': {
+                    'id': user['id'],
+                    'email': user['email'],
+                    'username': user['username'],
+                    'energy': user['energy'],
+                    'isInfiniteEnergy': user['is_infinite_energy'],
+                    'isAdmin': user['is_admin']
+                }
+            })
 
 def logout_user(data: Dict[str, Any]) -> Dict[str, Any]:
     token = data.get('token', '')
     
     if not token:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'Token is required'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
+        return json_response(400, {'error': 'Token is required'})
+    
+    with get_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("UPDATE sessions SET expires_at = CURRENT_TIMESTAMP WHERE session_token = %s", (token,))
+            claims = parse_token(token, check_expiry=False) if is_signed_token(token) else None
+            if claims is not None:
+                revoke(conn, claims)
             conn.commit()
+            session_cache.invalidate_token(token)
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({'success': True}),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            return json_response(200, {'success': True})
+
+def lookup_session(token: str) -> Optional[Dict[str, Any]]:
+    claims = None
+    if is_signed_token(token):
+        claims = parse_token(token)
+        if claims is None or is_revoked(claims, get_db_connection):
+            return None
+    
+    cached = session_cache.get(token)
+    if cached is not None:
+        return cached
+    
+    def read(read_only: bool) -> Optional[Dict[str, Any]]:
+        with get_db_connection(read_only) as conn:
+            with dict_cursor(conn) as cur:
+                if claims is not None:
+                    execute_prepared(cur, USER_BY_ID, (claims['expiresAt'], claims['userId']))
+                else:
+                    execute_prepared(cur, SESSION_USER, (token,))
+                return cur.fetchone()
+    
+    # Verify traffic goes to a replica when one is configured; a just-created session falls back to the primary
+    row = read_your_writes(read)
+    
+    if not row:
+        return None
+    
+    user = {
+        'id': row['id'],
+        'email': row['email'],
+        'username': row['username'],
+        'energy': row['energy'],
+        'isInfiniteEnergy': row['is_infinite_energy'],
+        'isAdmin': row['is_admin']
+    }
+    session_cache.put(token, user['id'], user, row['expires_at'])
+    return user
 
 def verify_token(data: Dict[str, Any]) -> Dict[str, Any]:
     token = data.get('token', '')
     
     if not token:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'Token is required'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """SELECT u.id, u.email, u.username, u.energy, u.is_infinite_energy, u.is_admin
-                   FROM sessions s
-                   JOIN users u ON s.user_id = u.id
-                   WHERE s.session_token = %s AND s.expires_at > CURRENT_TIMESTAMP""",
-                (token,)
-            )
-            user = cur.fetchone()
-            
-            if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'Invalid or expired token'}),
-                    'isBase64Encoded': False
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({
-                    'user': {
-                        'id': user['id'],
-                        'email': user['email'],
-                        'username': user['username'],
-                        'energy': user['energy'],
-                        'isInfiniteEnergy': user['is_infinite_energy'],
-                        'isAdmin': user['is_admin']
-                    }
-                }),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+        return json_response(400, {'error': 'Token is required'})
+    
+    user = lookup_session(token)
+    
+    if not user:
+        return json_response(401, {'error': 'Invalid or expired token'})
+    
+    return json_response(200, {'user': user})
+
+def get_cache_stats(data: Dict[str, Any]) -> Dict[str, Any]:
+    user = lookup_session(data.get('token', ''))
+    
+    if not user or not user['isAdmin']:
+        return json_response(403, {'error': 'Admin access required'})
+    
+    return json_response(200, {
+        'sessionCache': session_cache.stats(),
+        'loginThrottle': buckets.stats(),
+        'lastLoginWriteBehind': last_login_buffer.stats() if LAST_LOGIN_WRITE_BEHIND else {'enabled': False},
+        'routing': routing_stats
+    })
+
+def get_timing_stats(data: Dict[str, Any]) -> Dict[str, Any]:
+    user = lookup_session(data.get('token', ''))
+    
+    if not user or not user['isAdmin']:
+        return json_response(403, {'error': 'Admin access required'})
+    
+    return json_response(200, {'timing': snapshot()})
 
 def update_password(data: Dict[str, Any]) -> Dict[str, Any]:
     email = data.get('email', '').strip().lower()
@@ -284,45 +336,117 @@ def update_password(data: Dict[str, Any]) -> Dict[str, Any]:
     new_password = data.get('newPassword', '')
     
     if not email or not old_password or not new_password:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'Email, old password and new password are required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Email, old password and new password are required'})
     
     if len(new_password) < 6:
-        return {
-            'statusCode': 400,
-            'headers': cors_headers(),
-            'body': json.dumps({'error': 'New password must be at least 6 characters'}),
-            'isBase64Encoded': False
-        }
-    
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            old_hash = hash_password(old_password)
-            cur.execute("SELECT id FROM users WHERE email = %s AND password_hash = %s", (email, old_hash))
+        return json_response(400, {'error': 'New password must be at least 6 characters'})
+    
+    wait = throttle_attempt(email, get_db_connection)
+    if wait:
+        return throttled_response(wait)
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
+            cur.execute("SELECT id, password_hash FROM users WHERE email = %s", (email,))
             user = cur.fetchone()
-            
-            if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': cors_headers(),
-                    'body': json.dumps({'error': 'Invalid email or password'}),
-                    'isBase64Encoded': False
-                }
-            
-            new_hash = hash_password(new_password)
+    
+    valid, _ = verify_password(old_password, user['password_hash'] if user else None)
+    
+    if not valid:
+        return json_response(401, {'error': 'Invalid email or password'})
+    
+    new_hash = hash_password(new_password)
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
             cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user['id']))
             conn.commit()
+            session_cache.invalidate_user(user['id'])
+            
+            return json_response(200, {'success': True})
+
+CONSUME_MAX_AMOUNT = 1000000
+
+def consume_energy(data: Dict[str, Any]) -> Dict[str, Any]:
+    token = data.get('token', '')
+    amount = data.get('amount')
+    idempotency_key = data.get('idempotencyKey')
+    description = data.get('description') or 'Energy consumed'
+    
+    if not token:
+        return json_response(400, {'error': 'Token is required'})
+    
+    if (not isinstance(amount, int) or isinstance(amount, bool)
+            or not 0 < amount <= CONSUME_MAX_AMOUNT):
+        return json_response(400, {'error': 'Amount must be a positive integer'})
+    
+    if idempotency_key is not None and (not isinstance(idempotency_key, str) or not 0 < len(idempotency_key) <= 100):
+        return json_response(400, {'error': 'idempotencyKey must be a string of at most 100 characters'})
+    
+    user = lookup_session(token)
+    if not user:
+        return json_response(401, {'error': 'Invalid or expired token'})
+    
+    with get_db_connection() as conn:
+        with dict_cursor(conn) as cur:
+            # One statement: claim the idempotency key, conditionally debit, write the ledger row.
+            # A concurrent retry with the same key blocks on the key's unique index and then claims nothing.
+            cur.execute(
+                """WITH claimed AS (
+                       INSERT INTO energy_idempotency_keys (user_id, idempotency_key)
+                       SELECT %(user_id)s, %(key)s WHERE %(key)s IS NOT NULL
+                       ON CONFLICT DO NOTHING
+                       RETURNING user_id
+                   ),
+                   updated AS (
+                       UPDATE users
+                       SET energy = energy - CASE WHEN is_infinite_energy THEN 0 ELSE %(amount)s END
+                       WHERE id = %(user_id)s
+                         AND (is_infinite_energy OR energy >= %(amount)s)
+                         AND (%(key)s IS NULL OR EXISTS (SELECT 1 FROM claimed))
+                       RETURNING id, energy, is_infinite_energy
+                   ),
+                   ledger AS (
+                       INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+                       SELECT id, -%(amount)s, 'consume', %(description)s FROM updated
+                       RETURNING id
+                   )
+                   SELECT (SELECT id FROM ledger) AS transaction_id,
+                          (SELECT energy FROM updated) AS new_energy,
+                          EXISTS (SELECT 1 FROM claimed) AS claimed,
+                          u.energy AS current_energy,
+                          u.is_infinite_energy
+                   FROM (SELECT 1) AS one
+                   LEFT JOIN users u ON u.id = %(user_id)s""",
+                {'user_id': user['id'], 'amount': amount, 'key': idempotency_key,
+                 'description': str(description)[:200]}
+            )
+            result = cur.fetchone()
+            
+            if result['transaction_id'] is not None:
+                conn.commit()
+                session_cache.invalidate_user(user['id'])
+                return json_response(200, {
+                    'success': True,
+                    'energy': result['new_energy'],
+                    'isInfiniteEnergy': result['is_infinite_energy'],
+                    'transactionId': result['transaction_id'],
+                    'replayed': False
+                })
+            
+            conn.rollback()
+            
+            if result['current_energy'] is None:
+                return json_response(404, {'error': 'User not found'})
+            
+            if idempotency_key is not None and not result['claimed']:
+                cur.execute("SELECT energy, is_infinite_energy FROM users WHERE id = %s", (user['id'],))
+                current = cur.fetchone()
+                return json_response(200, {
+                    'success': True,
+                    'energy': current['energy'],
+                    'isInfiniteEnergy': current['is_infinite_energy'],
+                    'replayed': True
+                })
             
-            return {
-                'statusCode': 200,
-                'headers': cors_headers(),
-                'body': json.dumps({'success': True}),
-                'isBase64Encoded': False
-            }
-    finally:
-        conn.close()
+            return json_response(409, {'error': 'Insufficient energy', 'energy': result['current_energy']})
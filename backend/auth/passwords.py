@@ -0,0 +1,95 @@
+"""
+Хеширование паролей: версионированный формат scrypt$<n>$<r>$<p>$<salt>$<hash> (hashlib.scrypt).
+Параметры подбираются под развёртывание (PASSWORD_SCRYPT_N/R/P, см. benchmarks/password_kdf_calibration.py).
+Старые хеши sha256 (64 hex-символа) проверяются в постоянном времени и помечаются для перехеширования.
+Вычисления идут в ограниченном пуле потоков (hashlib.scrypt отпускает GIL): PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from typing import Optional, Tuple
+
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '16'))
+HASH_WAIT = float(os.environ.get('PASSWORD_HASH_WAIT', '2'))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+class PasswordHasherBusy(Exception):
+    pass
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode().rstrip('=')
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+def _hash_sync(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    return f'scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}'
+
+def _verify_sync(password: str, stored: str) -> Tuple[bool, bool]:
+    if stored.startswith('scrypt$'):
+        try:
+            _, n, r, p, salt, expected = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            actual = _scrypt(password, _unb64(salt), n, r, p)
+            expected_bytes = _unb64(expected)
+        except ValueError:
+            return False, False
+        ok = hmac.compare_digest(actual, expected_bytes)
+        return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    ok = hmac.compare_digest(legacy, stored)
+    return ok, ok
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # concurrent.futures pulls in logging; importing it here keeps it off the cold-start path
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+    return _executor
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=HASH_WAIT):
+        raise PasswordHasherBusy('Password hashing capacity exhausted')
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+# A real hash to burn the same time on unknown emails, so response time does not reveal registered addresses
+_DUMMY_HASH: Optional[str] = None
+
+def hash_password(password: str) -> str:
+    return _run(_hash_sync, password)
+
+def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    global _DUMMY_HASH
+    if stored is None:
+        if _DUMMY_HASH is None:
+            _DUMMY_HASH = _hash_sync(secrets.token_hex(8))
+        _run(_verify_sync, password, _DUMMY_HASH)
+        return False, False
+    return _run(_verify_sync, password, stored)
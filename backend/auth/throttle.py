@@ -0,0 +1,132 @@
+"""
+Ограничение попыток входа и смены пароля: token bucket на email и на IP клиента (requestContext.identity.sourceIp).
+Корзины живут в памяти экземпляра: не больше LOGIN_THROTTLE_SIZE, полная корзина ничем не отличается
+от отсутствующей и удаляется при следующем обращении к таблице. Отказ — до хеширования пароля и запросов в базу.
+При LOGIN_THROTTLE_SHARED=1 прошедшая локальную проверку попытка списывается ещё и из общей таблицы
+login_throttle (V0012) одним запросом — лимит действует на все экземпляры функции.
+Настройки: LOGIN_EMAIL_BURST / LOGIN_EMAIL_PER_MINUTE, LOGIN_IP_BURST / LOGIN_IP_PER_MINUTE.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LOGIN_EMAIL_BURST = float(os.environ.get('LOGIN_EMAIL_BURST', '5'))
+LOGIN_EMAIL_PER_MINUTE = float(os.environ.get('LOGIN_EMAIL_PER_MINUTE', '5'))
+LOGIN_IP_BURST = float(os.environ.get('LOGIN_IP_BURST', '20'))
+LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE', '30'))
+LOGIN_THROTTLE_SIZE = int(os.environ.get('LOGIN_THROTTLE_SIZE', '10000'))
+LOGIN_THROTTLE_SHARED = os.environ.get('LOGIN_THROTTLE_SHARED', '0') == '1'
+
+# One round trip for every bucket of an attempt; a bucket never drops below -1, so a burst of rejected
+# attempts does not push the next allowed one further into the future
+SHARED_TAKE_SQL = """
+    INSERT INTO login_throttle AS t (key, tokens, rate, updated_at)
+    SELECT k.key, k.burst - 1, k.rate, clock_timestamp()
+    FROM unnest(%s::varchar[], %s::float8[], %s::float8[]) AS k(key, burst, rate)
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = GREATEST(LEAST(EXCLUDED.tokens + 1,
+                                t.tokens + EXTRACT(EPOCH FROM clock_timestamp() - t.updated_at) * EXCLUDED.rate) - 1, -1),
+        rate = EXCLUDED.rate,
+        updated_at = clock_timestamp()
+    RETURNING tokens, rate"""
+
+_client_ip: contextvars.ContextVar = contextvars.ContextVar('client_ip', default='')
+
+def begin_attempts(event: Dict[str, Any]) -> None:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    _client_ip.set(str(identity.get('sourceIp') or ''))
+
+class TokenBuckets:
+    def __init__(self, max_size: int = LOGIN_THROTTLE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # key -> (tokens, updated_at, burst, rate per second); ordered by last update, oldest first
+        self._buckets: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.counters = {'allowed': 0, 'rejected': 0, 'evictions': 0, 'expirations': 0}
+
+    def _level(self, key: str, now: float) -> Optional[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+        tokens, updated_at, burst, rate = bucket
+        return min(burst, tokens + (now - updated_at) * rate)
+
+    def _expire(self, now: float) -> None:
+        # The front is the least recently updated bucket; once it is full again it carries no state.
+        # Buckets refill at different rates, so a slow one at the front may hold back faster ones for a while
+        while self._buckets:
+            key, (tokens, updated_at, burst, rate) = next(iter(self._buckets.items()))
+            if tokens + (now - updated_at) * rate < burst:
+                break
+            del self._buckets[key]
+            self.counters['expirations'] += 1
+
+    # Spends one token from every (key, burst, rate) bucket or from none; returns seconds to wait, 0 if allowed
+    def take(self, limits: List[Tuple[str, float, float]]) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            levels = []
+            wait = 0.0
+            for key, burst, rate in limits:
+                level = self._level(key, now)
+                level = burst if level is None else level
+                levels.append(level)
+                if level < 1:
+                    wait = max(wait, (1 - level) / rate)
+            if wait > 0:
+                self.counters['rejected'] += 1
+                return wait
+            for (key, burst, rate), level in zip(limits, levels):
+                self._buckets.pop(key, None)
+                self._buckets[key] = (level - 1, now, burst, rate)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+                self.counters['evictions'] += 1
+            self.counters['allowed'] += 1
+            return 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, 'size': len(self._buckets), 'maxSize': self.max_size, 'shared': LOGIN_THROTTLE_SHARED}
+
+buckets = TokenBuckets()
+
+# A zero rate switches the corresponding limit off
+def attempt_limits(email: str) -> List[Tuple[str, float, float]]:
+    limits = []
+    if LOGIN_EMAIL_PER_MINUTE > 0:
+        limits.append((f'email:{email}', LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE / 60))
+    client_ip = _client_ip.get()
+    if client_ip and LOGIN_IP_PER_MINUTE > 0:
+        limits.append((f'ip:{client_ip}', LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60))
+    return limits
+
+def shared_take(limits: List[Tuple[str, float, float]], get_connection: Callable) -> float:
+    keys, bursts, rates = (list(column) for column in zip(*limits))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SHARED_TAKE_SQL, (keys, bursts, rates))
+            rows = cur.fetchall()
+            conn.commit()
+    wait = 0.0
+    for tokens, rate in rows:
+        if tokens < 0:
+            wait = max(wait, -tokens / rate)
+    return wait
+
+def throttle_attempt(email: str, get_connection: Callable) -> float:
+    limits = attempt_limits(email)
+    if not limits:
+        return 0.0
+    wait = buckets.take(limits)
+    if wait == 0 and LOGIN_THROTTLE_SHARED:
+        wait = shared_take(limits, get_connection)
+    return wait
@@ -0,0 +1,138 @@
+"""
+Отложенная запись отметок «последний раз видели» (last_login и подобные): вместо UPDATE горячей строки users
+на каждый вход отметки копятся в памяти экземпляра и пишутся одним UPDATE ... FROM (VALUES ...).
+Запись — когда накопилось WRITE_BEHIND_MAX_ROWS пользователей или самой старой отметке WRITE_BEHIND_MAX_DELAY секунд
+(таймер плюс проверка на каждой отметке — замороженный экземпляр догоняет при следующем вызове), и при выходе процесса.
+Запись идёт в фоновом потоке, запрос входа её не ждёт.
+Включается LAST_LOGIN_WRITE_BEHIND=1 (только тогда index.py импортирует модуль); при падении экземпляра теряются только ещё не записанные отметки.
+Фактическое устаревание (возраст самой старой отметки в момент записи) отдаётся в stats().
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from db import driver, get_db_connection
+
+WRITE_BEHIND_MAX_ROWS = int(os.environ.get('WRITE_BEHIND_MAX_ROWS', '500'))
+WRITE_BEHIND_MAX_DELAY = float(os.environ.get('WRITE_BEHIND_MAX_DELAY', '30'))
+
+class WriteBehind:
+    def __init__(self, column: str, max_rows: int = WRITE_BEHIND_MAX_ROWS, max_delay: float = WRITE_BEHIND_MAX_DELAY):
+        self.column = column
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # user_id -> latest timestamp; only the newest touch per user is ever written
+        self._pending: Dict[int, datetime] = {}
+        self._oldest: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._flush_requested = False
+        self.counters = {'touches': 0, 'coalesced': 0, 'flushes': 0, 'rowsFlushed': 0, 'errors': 0}
+        self.max_staleness = 0.0
+        self.last_staleness = 0.0
+
+    def touch(self, user_id: int, at: Optional[datetime] = None) -> None:
+        at = at or datetime.now()
+        with self._lock:
+            self.counters['touches'] += 1
+            previous = self._pending.get(user_id)
+            if previous is not None:
+                self.counters['coalesced'] += 1
+                at = max(previous, at)
+            self._pending[user_id] = at
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._arm_timer(self.max_delay)
+            elif not self._flush_requested and (
+                    len(self._pending) >= self.max_rows or time.monotonic() - self._oldest >= self.max_delay):
+                # Flushed off the request thread: the caller may still hold its pooled connection
+                self._flush_requested = True
+                self._arm_timer(0)
+
+    def _arm_timer(self, delay: float) -> None:
+        if self._timer is not None:
+            if delay > 0:
+                return
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush_quietly()
+
+    def _take(self) -> Tuple[Dict[int, datetime], Optional[float]]:
+        with self._lock:
+            pending, oldest = self._pending, self._oldest
+            self._pending, self._oldest = {}, None
+            self._flush_requested = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            return pending, oldest
+
+    def flush(self) -> int:
+        # One writer at a time keeps the UPDATEs from locking the same rows in different orders
+        with self._flush_lock:
+            pending, oldest = self._take()
+            if not pending:
+                return 0
+            rows = sorted(pending.items())
+            try:
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        # GREATEST keeps a newer value written directly (or by another instance) from going back in time
+                        driver().extras.execute_values(cur, f"""
+                            UPDATE users u SET {self.column} = GREATEST(u.{self.column}, v.at)
+                            FROM (VALUES %s) AS v(id, at)
+                            WHERE u.id = v.id""", rows, template='(%s::int, %s::timestamp)', page_size=len(rows))
+                        conn.commit()
+            except Exception:
+                self._restore(pending, oldest)
+                with self._lock:
+                    self.counters['errors'] += 1
+                raise
+            staleness = time.monotonic() - oldest
+            with self._lock:
+                self.counters['flushes'] += 1
+                self.counters['rowsFlushed'] += len(rows)
+                self.last_staleness = staleness
+                self.max_staleness = max(self.max_staleness, staleness)
+            return len(rows)
+
+    def _restore(self, pending: Dict[int, datetime], oldest: float) -> None:
+        with self._lock:
+            for user_id, at in pending.items():
+                current = self._pending.get(user_id)
+                self._pending[user_id] = at if current is None else max(current, at)
+            self._oldest = oldest if self._oldest is None else min(oldest, self._oldest)
+            self._arm_timer(self.max_delay)
+
+    def flush_quietly(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                'enabled': True,
+                'column': self.column,
+                'pending': len(self._pending),
+                'pendingAgeSeconds': round(time.monotonic() - self._oldest, 3) if self._oldest is not None else 0.0,
+                'maxRows': self.max_rows,
+                'maxDelaySeconds': self.max_delay,
+                'lastStalenessSeconds': round(self.last_staleness, 3),
+                'maxStalenessSeconds': round(self.max_staleness, 3)
+            }
+
+last_login_buffer = WriteBehind('last_login')
+# Best effort: a frozen or killed instance never runs atexit, which is the staleness the buffer accepts
+atexit.register(last_login_buffer.flush_quietly)
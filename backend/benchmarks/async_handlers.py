@@ -0,0 +1,92 @@
+"""
+Пропускная способность одного экземпляра функции: синхронный index.handler (один вызов за раз)
+против асинхронного aio.handler с несколькими вызовами в полёте.
+Действия verify (auth) и get_users (admin) идут в базу на каждом вызове — кеш сессий выключен.
+
+Запуск: DATABASE_URL=postgresql://... python backend/benchmarks/async_handlers.py --requests 2000 --in-flight 1 4 8 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import psycopg2
+from common import create_user, load_function, make_event, require_database_url, summarize
+
+def events(action: str, token: str) -> tuple:
+    if action == 'verify':
+        return 'auth', make_event({'action': 'verify', 'token': token})
+    return 'admin', make_event({'action': 'get_users', 'limit': 50}, {'X-Auth-Token': token})
+
+def bench_sync(function: str, event: dict, requests: int) -> dict:
+    index = load_function(function)
+    for _ in range(min(50, requests)):
+        index.handler(event, None)
+    samples = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        call_started = time.perf_counter()
+        response = index.handler(event, None)
+        samples.append(time.perf_counter() - call_started)
+        if response['statusCode'] != 200:
+            raise SystemExit(f"{function} failed: {response['body']}")
+    return summarize(samples, time.perf_counter() - started)
+
+async def drive(aio, event: dict, requests: int, in_flight: int) -> tuple:
+    samples = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            call_started = time.perf_counter()
+            response = await aio.handler(event, None)
+            samples.append(time.perf_counter() - call_started)
+            if response['statusCode'] != 200:
+                raise SystemExit(f"aio failed: {response['body']}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(in_flight)))
+    return samples, time.perf_counter() - started
+
+def bench_async(function: str, event: dict, requests: int, in_flight: int) -> dict:
+    os.environ['AIO_MAX_IN_FLIGHT'] = str(in_flight)
+    os.environ['DB_POOL_MAX_SIZE'] = str(in_flight)
+    aio = load_function(function, 'aio')
+    asyncio.run(drive(aio, event, min(50, requests), in_flight))
+    samples, elapsed = asyncio.run(drive(aio, event, requests, in_flight))
+    return summarize(samples, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--actions', nargs='+', default=['verify', 'get_users'], choices=['verify', 'get_users'])
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    os.environ['SESSION_CACHE_TTL'] = '0'
+    os.environ['DB_POOL_MIN_SIZE'] = '1'
+    conn = psycopg2.connect(dsn)
+    try:
+        user_id, token = create_user(conn)
+        with conn.cursor() as cur:
+            cur.execute("UPDATE users SET is_admin = TRUE WHERE id = %s", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    report = {'requests': args.requests}
+    for action in args.actions:
+        function, event = events(action, token)
+        os.environ['DB_POOL_MAX_SIZE'] = '1'
+        sync = bench_sync(function, event, args.requests)
+        results = {'sync': sync}
+        for in_flight in args.in_flight:
+            result = bench_async(function, event, args.requests, in_flight)
+            result['speedup'] = round(result['throughput'] / sync['throughput'], 2) if sync['throughput'] else None
+            results[f'async_{in_flight}'] = result
+        report[action] = results
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
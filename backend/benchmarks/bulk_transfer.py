@@ -0,0 +1,141 @@
+"""
+Выгрузка и загрузка через COPY (admin export_table / import_rows): строк и мегабайт в секунду на миллионах строк.
+Выгрузка идёт пачками по курсору до конца таблицы; пик памяти процесса на пачку (tracemalloc) показывает,
+что расход не растёт с размером таблицы. Загрузка — CSV с новыми пользователями и начислениями энергии им же.
+Перед замером в users и energy_transactions добавляются строки с уникальной меткой прогона.
+
+Запуск: DATABASE_URL=postgresql://... python backend/benchmarks/bulk_transfer.py --users 1000000 --ledger 3000000
+        python backend/benchmarks/bulk_transfer.py --skip-seed --formats csv --import-rows 0
+"""
+import argparse
+import json
+import os
+import secrets
+import time
+import tracemalloc
+import psycopg2
+from common import create_user, load_function, make_event, require_database_url
+
+def seed(conn, users: int, ledger: int) -> str:
+    tag = secrets.token_hex(3)
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO users (email, username, password_hash, energy)
+               SELECT 'u' || n || '@transfer-' || %(tag)s || '.example.com', 'transfer_' || %(tag)s || '_' || n,
+                      'bench', (random() * 1000)::int
+               FROM generate_series(1, %(users)s) n""",
+            {'tag': tag, 'users': users}
+        )
+        cur.execute("SELECT MIN(id), MAX(id) FROM users WHERE email LIKE %s", (f'%@transfer-{tag}.example.com',))
+        first_id, last_id = cur.fetchone()
+        if ledger and first_id is not None:
+            # The seeded ids form one range, so ledger rows can spread over it without a lookup per row
+            cur.execute(
+                """INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+                   SELECT %(first)s + n %% (%(last)s - %(first)s + 1), (random() * 200 - 100)::int,
+                          'bench_transfer', 'Bulk transfer benchmark'
+                   FROM generate_series(1, %(ledger)s) n""",
+                {'first': first_id, 'last': last_id, 'ledger': ledger}
+            )
+        cur.execute("ANALYZE users")
+        cur.execute("ANALYZE energy_transactions")
+    conn.commit()
+    return tag
+
+def call(admin, token: str, body: dict) -> dict:
+    response = admin.handler(make_event(body, {'X-Auth-Token': token}), None)
+    if response['statusCode'] != 200:
+        raise SystemExit(f"{body['action']} failed: {response['body']}")
+    return response
+
+def bench_export(admin, token: str, table: str, export_format: str, chunk: int) -> dict:
+    rows = chunks = size = peak = 0
+    cursor = ''
+    started = time.perf_counter()
+    while True:
+        tracemalloc.start()
+        response = call(admin, token, {
+            'action': 'export_table', 'table': table, 'format': export_format, 'limit': chunk, 'cursor': cursor
+        })
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        rows += int(response['headers']['X-Row-Count'])
+        size += len(response['body'])
+        chunks += 1
+        cursor = response['headers']['X-Next-Cursor']
+        if not cursor:
+            break
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'chunks': chunks,
+        'seconds': round(elapsed, 2),
+        'rowsPerSecond': round(rows / elapsed) if elapsed else 0,
+        'mbPerSecond': round(size / elapsed / 1e6, 2) if elapsed else 0,
+        'peakChunkMemoryMb': round(peak / 1e6, 2)
+    }
+
+def bench_import(admin, token: str, kind: str, lines, chunk: int, header: str) -> dict:
+    totals = {'rows': 0, 'applied': 0}
+
+    def send(batch: list) -> None:
+        result = json.loads(call(admin, token, {'action': 'import_rows', 'kind': kind, 'data': header + ''.join(batch)})['body'])
+        totals['rows'] += result['rows']
+        totals['applied'] += result['applied']
+
+    started = time.perf_counter()
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == chunk:
+            send(batch)
+            batch = []
+    if batch:
+        send(batch)
+    elapsed = time.perf_counter() - started
+    return {**totals, 'seconds': round(elapsed, 2), 'rowsPerSecond': round(totals['rows'] / elapsed) if elapsed else 0}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000000, help='users to add before measuring')
+    parser.add_argument('--ledger', type=int, default=2000000, help='ledger rows to add before measuring')
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--chunk', type=int, default=10000, help='rows per export call')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'ndjson'], choices=['csv', 'ndjson'])
+    parser.add_argument('--import-rows', type=int, default=1000000, help='users (and as many grants) to import')
+    parser.add_argument('--import-chunk', type=int, default=50000, help='rows per import call')
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    os.environ['SESSION_CACHE_TTL'] = '60'
+    os.environ['IMPORT_MAX_ROWS'] = str(args.import_chunk)
+    conn = psycopg2.connect(dsn)
+    try:
+        seeded_at = time.perf_counter()
+        tag = None if args.skip_seed else seed(conn, args.users, args.ledger)
+        seed_seconds = time.perf_counter() - seeded_at
+        user_id, token = create_user(conn)
+        with conn.cursor() as cur:
+            cur.execute("UPDATE users SET is_admin = TRUE WHERE id = %s", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    admin = load_function('admin')
+    report = {'seedTag': tag, 'seedSeconds': round(seed_seconds, 2), 'export': {}}
+    for table in ('users', 'energy_transactions'):
+        for export_format in args.formats:
+            report['export'][f'{table}_{export_format}'] = bench_export(admin, token, table, export_format, args.chunk)
+
+    if args.import_rows > 0:
+        run = secrets.token_hex(3)
+        users = (f'imported{n}@import-{run}.example.com,imported_{run}_{n},250\n' for n in range(args.import_rows))
+        grants = (f'imported{n}@import-{run}.example.com,25,bench_import\n' for n in range(args.import_rows))
+        report['import'] = {
+            'users': bench_import(admin, token, 'users', users, args.import_chunk, 'email,username,energy\n'),
+            'energy': bench_import(admin, token, 'energy', grants, args.import_chunk, 'email,amount,transaction_type\n')
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Бенчмарк холодного старта облачных функций: время импорта index.py и первого запроса в свежем интерпретаторе.
+Медианы сравниваются с сохранённой базой cold_start_baseline.json; регрессия сверх допуска даёт код выхода 1.
+
+Запуск:  python backend/benchmarks/cold_start.py                    # сравнить с базой
+         python backend/benchmarks/cold_start.py --update-baseline  # записать новую базу
+         DATABASE_URL=... python backend/benchmarks/cold_start.py --with-db  # первый запрос с обращением к базе
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(HERE)
+BASELINE_PATH = os.path.join(HERE, 'cold_start_baseline.json')
+
+# First requests that stay off the database, so the measurement is import + request handling only
+OFFLINE_EVENTS = {
+    'auth': {'httpMethod': 'POST', 'body': json.dumps({'action': 'unknown'})},
+    'admin': {'httpMethod': 'POST', 'headers': {}, 'body': json.dumps({'action': 'get_stats'})},
+    'setup-admin': {'httpMethod': 'GET'}
+}
+DB_EVENTS = {
+    'auth': {'httpMethod': 'POST', 'body': json.dumps({'action': 'verify', 'token': 'cold-start-probe'})},
+    'admin': {'httpMethod': 'POST', 'headers': {'X-Auth-Token': 'cold-start-probe'}, 'body': json.dumps({'action': 'get_stats'})},
+    'setup-admin': {'httpMethod': 'GET'}
+}
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import index
+imported = time.perf_counter()
+event = json.loads(sys.argv[2])
+index.handler({'httpMethod': 'OPTIONS'}, None)
+preflight = time.perf_counter()
+index.handler(event, None)
+first = time.perf_counter()
+index.handler(event, None)
+warm = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'preflight_ms': (preflight - imported) * 1000,
+    'first_request_ms': (first - preflight) * 1000,
+    'warm_request_ms': (warm - first) * 1000,
+    'driver_loaded': 'psycopg2' in sys.modules
+}))
+'''
+
+def probe(function: str, event: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, os.path.join(BACKEND_DIR, function), json.dumps(event)],
+        capture_output=True, text=True, check=True, cwd=os.path.join(BACKEND_DIR, function)
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def measure(function: str, event: dict, runs: int) -> dict:
+    samples = [probe(function, event) for _ in range(runs)]
+    result = {
+        key: round(statistics.median(s[key] for s in samples), 3)
+        for key in ('import_ms', 'preflight_ms', 'first_request_ms', 'warm_request_ms')
+    }
+    result['total_ms'] = round(result['import_ms'] + result['first_request_ms'], 3)
+    result['driver_loaded'] = samples[-1]['driver_loaded']
+    return result
+
+def compare(current: dict, baseline: dict, tolerance: float, floor_ms: float) -> list:
+    regressions = []
+    for function, metrics in current.items():
+        base = baseline.get(function)
+        if not base:
+            continue
+        for key in ('import_ms', 'first_request_ms', 'total_ms'):
+            if key in base and metrics[key] > base[key] * (1 + tolerance) and metrics[key] - base[key] > floor_ms:
+                regressions.append({
+                    'function': function, 'metric': key,
+                    'baseline': base[key], 'current': metrics[key],
+                    'change': f"{(metrics[key] / base[key] - 1) * 100:+.1f}%" if base[key] else 'n/a'
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--with-db', action='store_true')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--floor-ms', type=float, default=5.0, help='ignore differences smaller than this')
+    args = parser.parse_args()
+
+    events = DB_EVENTS if args.with_db else OFFLINE_EVENTS
+    current = {function: measure(function, event, args.runs) for function, event in events.items()}
+    mode = 'db' if args.with_db else 'offline'
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = json.load(f)
+
+    if args.update_baseline:
+        baselines[mode] = current
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(json.dumps({'mode': mode, 'baseline': current}, indent=2))
+        return
+
+    regressions = compare(current, baselines.get(mode, {}), args.tolerance, args.floor_ms)
+    print(json.dumps({'mode': mode, 'current': current, 'baseline': baselines.get(mode), 'regressions': regressions}, indent=2))
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Общие помощники для бенчмарков: загрузка handler облачной функции в процесс и подсчёт перцентилей.
+Каждая функция (auth, admin, setup-admin) — отдельный каталог со своими index.py/db.py,
+поэтому модули функции импортируются изолированно и убираются из sys.modules после загрузки.
+"""
+import json
+import math
+import os
+import secrets
+import sys
+import importlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Per-request log lines from timing.py would interleave with the JSON reports printed to stdout
+os.environ.setdefault('TIMING_LOG', '0')
+# Every benchmark event comes from one address; login limits would turn load runs into 429s
+os.environ.setdefault('LOGIN_EMAIL_PER_MINUTE', '0')
+os.environ.setdefault('LOGIN_IP_PER_MINUTE', '0')
+
+def load_function(name: str, module_name: str = 'index'):
+    function_dir = os.path.join(BACKEND_DIR, name)
+    local_modules = {f[:-3] for f in os.listdir(function_dir) if f.endswith('.py')}
+    saved = {m: sys.modules.pop(m) for m in list(sys.modules) if m in local_modules}
+    sys.path.insert(0, function_dir)
+    try:
+        module = importlib.import_module(module_name)
+    finally:
+        sys.path.remove(function_dir)
+        for m in local_modules:
+            sys.modules.pop(m, None)
+        sys.modules.update(saved)
+    return module
+
+def make_event(body: Dict[str, Any], headers: Dict[str, str] = None, method: str = 'POST') -> Dict[str, Any]:
+    return {
+        'httpMethod': method,
+        'headers': headers or {},
+        'body': json.dumps(body),
+        'requestContext': {'identity': {'sourceIp': '127.0.0.1'}}
+    }
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples: List[float], elapsed: float) -> Dict[str, float]:
+    return {
+        'count': len(samples),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0
+    }
+
+def require_database_url() -> str:
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        sys.exit('DATABASE_URL must point to a local PostgreSQL with db_migrations applied')
+    return url
+
+def create_user(conn, energy: int = 100) -> Tuple[int, str]:
+    suffix = secrets.token_hex(6)
+    token = secrets.token_urlsafe(32)
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO users (email, username, password_hash, energy)
+               VALUES (%s, %s, 'bench', %s) RETURNING id""",
+            (f'bench-{suffix}@example.com', f'bench-{suffix}', energy)
+        )
+        user_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)",
+            (user_id, token, datetime.now() + timedelta(hours=1))
+        )
+    conn.commit()
+    return user_id, token
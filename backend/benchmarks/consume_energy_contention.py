@@ -0,0 +1,130 @@
+"""
+Бенчмарк конкурентного списания энергии с одной строки users.
+Сравнивает действие consume_energy (условный UPDATE ... RETURNING + ключ идемпотентности)
+с прежней схемой SELECT-затем-UPDATE и проверяет, что ни одно списание не потеряно и не задвоено.
+
+Запуск: DATABASE_URL=postgresql://... python backend/benchmarks/consume_energy_contention.py --threads 32 --calls 200
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import psycopg2
+from common import create_user, load_function, make_event, require_database_url, summarize
+
+def read_state(conn, user_id: int):
+    with conn.cursor() as cur:
+        cur.execute("SELECT energy FROM users WHERE id = %s", (user_id,))
+        energy = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*), COALESCE(-SUM(amount), 0) FROM energy_transactions WHERE user_id = %s", (user_id,))
+        rows, charged = cur.fetchone()
+    conn.rollback()
+    return energy, rows, charged
+
+def run_threads(threads: int, calls: int, work):
+    samples = []
+    lock = threading.Lock()
+
+    def worker(worker_id: int):
+        local = []
+        for call in range(calls):
+            started = time.perf_counter()
+            work(worker_id, call)
+            local.append(time.perf_counter() - started)
+        with lock:
+            samples.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return samples, time.perf_counter() - started
+
+def bench_consume(auth, conn, threads: int, calls: int, retries: int):
+    initial = threads * calls
+    user_id, token = create_user(conn, initial)
+    outcomes = {'charged': 0, 'replayed': 0, 'rejected': 0}
+    lock = threading.Lock()
+
+    def work(worker_id: int, call: int):
+        key = f'{worker_id}-{call}'
+        for _ in range(1 + retries):
+            response = auth.handler(make_event({
+                'action': 'consume_energy', 'token': token, 'amount': 1, 'idempotencyKey': key
+            }), None)
+            body = json.loads(response['body'])
+            with lock:
+                if response['statusCode'] != 200:
+                    outcomes['rejected'] += 1
+                elif body.get('replayed'):
+                    outcomes['replayed'] += 1
+                else:
+                    outcomes['charged'] += 1
+
+    samples, elapsed = run_threads(threads, calls, work)
+    energy, rows, charged = read_state(conn, user_id)
+    return {
+        **summarize(samples, elapsed),
+        **outcomes,
+        'expectedEnergy': initial - outcomes['charged'],
+        'finalEnergy': energy,
+        'ledgerRows': rows,
+        'ledgerCharged': charged,
+        'consistent': energy == initial - outcomes['charged'] == initial - charged and rows == outcomes['charged']
+    }
+
+def bench_read_modify_write(dsn: str, conn, threads: int, calls: int):
+    initial = threads * calls
+    user_id, _ = create_user(conn, initial)
+    local = threading.local()
+
+    def work(worker_id: int, call: int):
+        if not hasattr(local, 'conn'):
+            local.conn = psycopg2.connect(dsn)
+        with local.conn.cursor() as cur:
+            cur.execute("SELECT energy FROM users WHERE id = %s", (user_id,))
+            energy = cur.fetchone()[0]
+            cur.execute("UPDATE users SET energy = %s WHERE id = %s", (max(0, energy - 1), user_id))
+            cur.execute(
+                """INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+                   VALUES (%s, -1, 'consume', 'benchmark')""",
+                (user_id,)
+            )
+        local.conn.commit()
+
+    samples, elapsed = run_threads(threads, calls, work)
+    energy, rows, charged = read_state(conn, user_id)
+    return {
+        **summarize(samples, elapsed),
+        'finalEnergy': energy,
+        'ledgerCharged': charged,
+        'lostUpdates': charged - (initial - energy)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--retries', type=int, default=1, help='extra resends of each request with the same idempotency key')
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.threads))
+    auth = load_function('auth')
+    conn = psycopg2.connect(dsn)
+    try:
+        report = {
+            'threads': args.threads,
+            'callsPerThread': args.calls,
+            'consumeEnergy': bench_consume(auth, conn, args.threads, args.calls, args.retries),
+            'readModifyWrite': bench_read_modify_write(dsn, conn, args.threads, args.calls)
+        }
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
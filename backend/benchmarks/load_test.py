@@ -0,0 +1,307 @@
+"""
+Нагрузочный прогон облачных функций auth и admin в одном процессе: handler(event, context) вызывается напрямую.
+Запросы строятся из auth/tests.json и admin/tests.json (действия без примера берутся из DEFAULT_REQUESTS),
+база предварительно заполняется пользователями, сессиями и транзакциями с уникальной меткой прогона.
+Отчёт — JSON с пропускной способностью и p50/p95/p99 по каждому action; --compare сверяет с отчётом другого коммита.
+
+Запуск: DATABASE_URL=postgresql://... python backend/benchmarks/load_test.py --users 10000 --concurrency 16 --requests 5000
+        python backend/benchmarks/load_test.py --output before.json
+        python backend/benchmarks/load_test.py --compare before.json   # код выхода 1 при регрессии
+Базу лучше брать одноразовую: засеянные строки не удаляются, чтобы не расходиться с дневными сводками.
+"""
+import argparse
+import base64
+import copy
+import gzip
+import json
+import os
+import random
+import secrets
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+import psycopg2
+from common import BACKEND_DIR, load_function, make_event, require_database_url, summarize
+
+SEED_PASSWORD = 'load-test-password'
+TRANSACTION_TYPES = ('consume', 'purchase', 'admin_adjustment')
+
+# Requests for actions that tests.json does not cover yet; the first successful tests.json case of an action
+# takes precedence (error and replay cases are for the fixtures, not for load)
+DEFAULT_REQUESTS = {
+    'register': {'function': 'auth', 'body': {'action': 'register'}, 'expectedStatus': 200},
+    'login': {'function': 'auth', 'body': {'action': 'login'}, 'expectedStatus': 200},
+    'verify': {'function': 'auth', 'body': {'action': 'verify'}, 'expectedStatus': 200,
+               'expectedBody': {'user': 'object'}, 'bodyMatcher': 'partial'},
+    'get_stats': {'function': 'admin', 'body': {'action': 'get_stats'}, 'expectedStatus': 200},
+    'get_users': {'function': 'admin', 'body': {'action': 'get_users', 'limit': 50}, 'expectedStatus': 200,
+                  'expectedBody': {'users': 'array'}, 'bodyMatcher': 'partial'},
+    'update_energy': {'function': 'admin', 'body': {'action': 'update_energy'}, 'expectedStatus': 200,
+                      'expectedBody': {'success': True}, 'bodyMatcher': 'partial'}
+}
+DEFAULT_MIX = 'register=1,login=2,verify=10,get_stats=1,get_users=2,update_energy=2'
+
+def load_requests() -> Dict[str, Dict[str, Any]]:
+    requests = copy.deepcopy(DEFAULT_REQUESTS)
+    from_tests = set()
+    for function in ('auth', 'admin'):
+        with open(os.path.join(BACKEND_DIR, function, 'tests.json')) as f:
+            for test in json.load(f)['tests']:
+                action = (test.get('body') or {}).get('action')
+                if action and action not in from_tests and 200 <= test.get('expectedStatus', 200) < 300:
+                    requests[action] = {**test, 'function': function}
+                    from_tests.add(action)
+    return requests
+
+def seed(conn, tag: str, users: int, sessions_per_user: int, transactions: int,
+         history_days: int, password_hash: str) -> Dict[str, Any]:
+    today = date.today()
+    with conn.cursor() as cur:
+        cur.execute("SELECT sessions_ensure_partitions(%s, %s)", (today, today + timedelta(days=31)))
+        cur.execute(
+            "SELECT ensure_monthly_partitions('energy_transactions', %s, %s)",
+            (today - timedelta(days=history_days), today)
+        )
+        cur.execute(
+            """INSERT INTO users (email, username, password_hash, energy, is_admin, created_at, last_login)
+               SELECT 'load-' || %(tag)s || '-' || n || '@example.com', 'load-' || %(tag)s || '-' || n,
+                      %(hash)s, (random() * 1000)::int, n = 0,
+                      CURRENT_TIMESTAMP - random() * make_interval(days => %(days)s),
+                      CASE WHEN random() < 0.8 THEN CURRENT_TIMESTAMP - random() * INTERVAL '7 days' END
+               FROM generate_series(0, %(users)s) n
+               RETURNING id, is_admin""",
+            {'tag': tag, 'hash': password_hash, 'days': history_days, 'users': users}
+        )
+        rows = cur.fetchall()
+        admin_id = next(user_id for user_id, is_admin in rows if is_admin)
+        user_ids = [user_id for user_id, is_admin in rows if not is_admin]
+        cur.execute(
+            """INSERT INTO sessions (user_id, session_token, expires_at)
+               SELECT u.id, 'load-' || %(tag)s || '-' || u.id || '-' || k, CURRENT_TIMESTAMP + INTERVAL '1 day'
+               FROM users u CROSS JOIN generate_series(1, %(per_user)s) k
+               WHERE u.email LIKE 'load-' || %(tag)s || '-%%'""",
+            {'tag': tag, 'per_user': sessions_per_user}
+        )
+        cur.execute(
+            """INSERT INTO energy_transactions (user_id, amount, transaction_type, description, created_at)
+               SELECT (%(ids)s::int[])[1 + floor(random() * %(count)s)::int],
+                      (random() * 200)::int - 100,
+                      (%(types)s::varchar[])[1 + floor(random() * 3)::int],
+                      'load test',
+                      CURRENT_TIMESTAMP - random() * make_interval(days => %(days)s)
+               FROM generate_series(1, %(transactions)s)""",
+            {'ids': user_ids, 'count': len(user_ids), 'types': list(TRANSACTION_TYPES),
+             'days': history_days, 'transactions': transactions}
+        )
+    conn.commit()
+    return {
+        'tag': tag,
+        'userIds': user_ids,
+        'adminToken': f'load-{tag}-{admin_id}-1',
+        'sessionTokens': [f'load-{tag}-{user_id}-{k}' for user_id in user_ids for k in range(1, sessions_per_user + 1)]
+    }
+
+def build_event(spec: Dict[str, Any], state: Dict[str, Any], rng: random.Random, sequence: int) -> Dict[str, Any]:
+    body = copy.deepcopy(spec.get('body') or {})
+    headers = dict(spec.get('headers') or {})
+    action = body['action']
+    if action == 'register':
+        suffix = f"{state['tag']}-r{sequence}"
+        body.update(email=f'load-{suffix}@example.com', username=f'load-{suffix}',
+                    password=body.get('password') or SEED_PASSWORD)
+    elif action == 'login':
+        body.update(email=state['emails'][rng.choice(state['userIds'])], password=SEED_PASSWORD)
+    elif action in ('verify', 'logout', 'consume_energy'):
+        body['token'] = rng.choice(state['sessionTokens'])
+    elif action == 'update_energy':
+        body.update(userId=rng.choice(state['userIds']), amount=rng.choice((-1, 1)))
+    if spec['function'] == 'admin':
+        headers = {k: v for k, v in headers.items() if k.lower() != 'x-auth-token'}
+        headers['X-Auth-Token'] = state['adminToken']
+    return make_event(body, headers, spec.get('method', 'POST'))
+
+def decode_body(response: Dict[str, Any]) -> Any:
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        body = gzip.decompress(base64.b64decode(body)).decode()
+    return json.loads(body) if body else None
+
+def matches(expected: Any, actual: Any) -> bool:
+    if expected in ('string', 'number', 'boolean', 'array', 'object'):
+        kinds = {'string': str, 'number': (int, float), 'boolean': bool, 'array': list, 'object': dict}
+        return isinstance(actual, kinds[expected]) and not (expected == 'number' and isinstance(actual, bool))
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(k in actual and matches(v, actual[k]) for k, v in expected.items())
+    return expected == actual
+
+def check(spec: Dict[str, Any], response: Dict[str, Any]) -> bool:
+    if response['statusCode'] != spec.get('expectedStatus', 200):
+        return False
+    expected = spec.get('expectedBody')
+    # Seeded data differs from the fixtures, so only the shape of the body is checked, not literal values
+    if not expected or spec.get('bodyMatcher') != 'partial':
+        return True
+    return matches(shape_of(expected), decode_body(response))
+
+def shape_of(expected: Any) -> Any:
+    if isinstance(expected, dict):
+        return {k: shape_of(v) for k, v in expected.items()}
+    if isinstance(expected, bool):
+        return 'boolean'
+    if isinstance(expected, (int, float)):
+        return 'number'
+    if isinstance(expected, str) and expected not in ('string', 'number', 'boolean', 'array', 'object'):
+        return 'string'
+    return expected
+
+def parse_mix(mix: str, requests: Dict[str, Dict[str, Any]]) -> List[Tuple[str, int]]:
+    weights = []
+    for part in mix.split(','):
+        action, _, weight = part.partition('=')
+        action = action.strip()
+        if action not in requests:
+            raise SystemExit(f'Unknown action in --mix: {action}')
+        weights.append((action, int(weight or 1)))
+    return weights
+
+def run(functions: Dict[str, Any], requests: Dict[str, Dict[str, Any]], state: Dict[str, Any],
+        mix: List[Tuple[str, int]], concurrency: int, total: int, seed_value: int) -> Dict[str, Any]:
+    actions = [action for action, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    failures: Counter = Counter()
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(worker_id: int):
+        rng = random.Random(seed_value + worker_id)
+        local_samples = defaultdict(list)
+        local_statuses = defaultdict(Counter)
+        local_failures = Counter()
+        while True:
+            with lock:
+                sequence = next(counter, None)
+            if sequence is None:
+                break
+            action = rng.choices(actions, weights)[0]
+            spec = requests[action]
+            event = build_event(spec, state, rng, sequence)
+            started = time.perf_counter()
+            response = functions[spec['function']].handler(event, None)
+            local_samples[action].append(time.perf_counter() - started)
+            local_statuses[action][response['statusCode']] += 1
+            if not check(spec, response):
+                local_failures[action] += 1
+        with lock:
+            for action, values in local_samples.items():
+                samples[action].extend(values)
+                statuses[action].update(local_statuses[action])
+            failures.update(local_failures)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        action: {
+            **summarize(samples[action], elapsed),
+            'statusCodes': {str(code): count for code, count in sorted(statuses[action].items())},
+            'unexpected': failures[action]
+        }
+        for action in actions if samples[action]
+    }
+    report['_all'] = summarize([s for values in samples.values() for s in values], elapsed)
+    return report
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, floor_ms: float) -> List[Dict[str, Any]]:
+    regressions = []
+    for action, metrics in current.items():
+        base = baseline.get(action)
+        if not base:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if metrics[key] > base[key] * (1 + tolerance) and metrics[key] - base[key] > floor_ms:
+                regressions.append({'action': action, 'metric': key, 'baseline': base[key], 'current': metrics[key]})
+        if metrics['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append({'action': action, 'metric': 'throughput',
+                                'baseline': base['throughput'], 'current': metrics['throughput']})
+    return regressions
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=BACKEND_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sessions-per-user', type=int, default=1)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--history-days', type=int, default=90)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000, help='total handler calls across all workers')
+    parser.add_argument('--warmup', type=int, default=100, help='calls made before measuring, not reported')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='weighted actions, e.g. verify=10,login=2')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--compare', help='report of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--floor-ms', type=float, default=1.0, help='ignore latency differences smaller than this')
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    functions = {'auth': load_function('auth'), 'admin': load_function('admin')}
+    requests = load_requests()
+    mix = parse_mix(args.mix, requests)
+
+    conn = psycopg2.connect(dsn)
+    try:
+        seeded_at = time.perf_counter()
+        state = seed(conn, secrets.token_hex(4), args.users, args.sessions_per_user, args.transactions,
+                     args.history_days, functions['auth'].hash_password(SEED_PASSWORD))
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, email FROM users WHERE id = ANY(%s)", (state['userIds'],))
+            state['emails'] = dict(cur.fetchall())
+        conn.rollback()
+        seed_seconds = time.perf_counter() - seeded_at
+    finally:
+        conn.close()
+
+    if args.warmup:
+        run(functions, requests, state, mix, args.concurrency, args.warmup, args.seed - 1)
+    results = run(functions, requests, state, mix, args.concurrency, args.requests, args.seed)
+
+    report = {
+        'commit': git_commit(),
+        'config': {key: getattr(args, key) for key in
+                   ('users', 'sessions_per_user', 'transactions', 'concurrency', 'requests', 'mix', 'seed')},
+        'seedSeconds': round(seed_seconds, 3),
+        'actions': results
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['baselineCommit'] = baseline.get('commit')
+        report['regressions'] = compare(results, baseline.get('actions', {}), args.tolerance, args.floor_ms)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if report.get('regressions'):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Ограничение попыток входа (auth throttle.py): сколько попыток в секунду экземпляр отклоняет с 429.
+Сначала сами корзины (TokenBuckets.take) на заполненной таблице, затем action login целиком от IP,
+исчерпавшего лимит, с перебором email — как при подборе паролей. Базе эти замеры не нужны.
+С DATABASE_URL для сравнения замеряются попытки с неверным паролем без ограничения: хеширование и запрос в users.
+
+Запуск: python backend/benchmarks/login_throttle.py --attempts 100000
+        DATABASE_URL=postgresql://... python backend/benchmarks/login_throttle.py --unthrottled 200
+"""
+import argparse
+import json
+import os
+import time
+from common import load_function, make_event, summarize
+
+ATTACKER_IP = '203.0.113.7'
+IP_BURST = 20
+IP_PER_MINUTE = 30
+
+def timed_calls(calls: int, work) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for n in range(calls):
+        call_started = time.perf_counter()
+        work(n)
+        samples.append(time.perf_counter() - call_started)
+    return summarize(samples, time.perf_counter() - started)
+
+def bench_buckets(throttle, attempts: int, keys: int) -> dict:
+    buckets = throttle.TokenBuckets(max_size=2 * keys)
+    limits = [[(f'email:victim{n}@example.com', 1, 1 / 60), (f'ip:10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}', 1, 1 / 60)]
+              for n in range(keys)]
+    for limit in limits:
+        buckets.take(limit)
+
+    def take(n):
+        if not buckets.take(limits[n % keys]):
+            raise SystemExit('bucket unexpectedly allowed an attempt')
+
+    return {**timed_calls(attempts, take), 'buckets': buckets.stats()['size']}
+
+def login_event(n: int, source_ip: str) -> dict:
+    event = make_event({'action': 'login', 'email': f'victim{n}@example.com', 'password': 'guess'})
+    event['requestContext']['identity']['sourceIp'] = source_ip
+    return event
+
+def bench_handler(attempts: int) -> dict:
+    os.environ['LOGIN_EMAIL_PER_MINUTE'] = '5'
+    os.environ['LOGIN_IP_BURST'] = str(IP_BURST)
+    os.environ['LOGIN_IP_PER_MINUTE'] = str(IP_PER_MINUTE)
+    auth = load_function('auth')
+    # Drain the attacker's IP bucket without touching the database
+    while not auth.buckets.take([(f'ip:{ATTACKER_IP}', IP_BURST, IP_PER_MINUTE / 60)]):
+        pass
+    events = [login_event(n, ATTACKER_IP) for n in range(1000)]
+
+    def login(n):
+        response = auth.handler(events[n % len(events)], None)
+        if response['statusCode'] != 429:
+            raise SystemExit(f"expected 429, got {response['statusCode']}: {response['body']}")
+
+    return timed_calls(attempts, login)
+
+def bench_unthrottled(attempts: int) -> dict:
+    os.environ['LOGIN_EMAIL_PER_MINUTE'] = '0'
+    os.environ['LOGIN_IP_PER_MINUTE'] = '0'
+    auth = load_function('auth')
+    events = [login_event(n, ATTACKER_IP) for n in range(attempts)]
+
+    def login(n):
+        response = auth.handler(events[n], None)
+        if response['statusCode'] != 401:
+            raise SystemExit(f"expected 401, got {response['statusCode']}: {response['body']}")
+
+    return timed_calls(attempts, login)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--attempts', type=int, default=50000)
+    parser.add_argument('--keys', type=int, default=10000, help='depleted email/IP bucket pairs in the table')
+    parser.add_argument('--unthrottled', type=int, default=100, help='attempts without limits; needs DATABASE_URL')
+    args = parser.parse_args()
+
+    report = {
+        'attempts': args.attempts,
+        'buckets': bench_buckets(load_function('auth', 'throttle'), args.attempts, args.keys),
+        'loginRejected': bench_handler(args.attempts)
+    }
+    if os.environ.get('DATABASE_URL') and args.unthrottled > 0:
+        report['loginUnthrottled'] = bench_unthrottled(args.unthrottled)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
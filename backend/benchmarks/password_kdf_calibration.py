@@ -0,0 +1,78 @@
+"""
+Калибровка стоимости scrypt под целевую задержку одного хеширования на текущем железе.
+Перебирает n = 2^k при заданных r и p, печатает замеры и значения переменных окружения для развёртывания.
+Затем проверяет пропускную способность пула PASSWORD_HASH_WORKERS при параллельных входах.
+
+Запуск: python backend/benchmarks/password_kdf_calibration.py --target-ms 50 --concurrency 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'auth'))
+import passwords
+
+def measure(n: int, r: int, p: int, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        passwords._hash_sync('calibration-password', n, r, p)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+def calibrate(target_ms: float, r: int, p: int, rounds: int):
+    chosen = None
+    table = []
+    for log_n in range(10, 21):
+        n = 2 ** log_n
+        elapsed = measure(n, r, p, rounds)
+        table.append({'n': n, 'ms': round(elapsed, 2)})
+        if elapsed > target_ms:
+            break
+        chosen = n
+    return chosen or 2 ** 10, table
+
+def pool_throughput(n: int, r: int, p: int, concurrency: int, total: int) -> dict:
+    passwords.SCRYPT_N, passwords.SCRYPT_R, passwords.SCRYPT_P = n, r, p
+    stored = passwords._hash_sync('calibration-password', n, r, p)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(lambda _: passwords.verify_password('calibration-password', stored), range(total)))
+    elapsed = time.perf_counter() - started
+    return {
+        'workers': passwords.HASH_WORKERS,
+        'clients': concurrency,
+        'verifications': total,
+        'allValid': all(ok for ok, _ in results),
+        'perSecond': round(total / elapsed, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target-ms', type=float, default=50)
+    parser.add_argument('--r', type=int, default=8)
+    parser.add_argument('--p', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--verifications', type=int, default=64)
+    args = parser.parse_args()
+
+    n, table = calibrate(args.target_ms, args.r, args.p, args.rounds)
+    report = {
+        'targetMs': args.target_ms,
+        'measurements': table,
+        'environment': {
+            'PASSWORD_SCRYPT_N': str(n),
+            'PASSWORD_SCRYPT_R': str(args.r),
+            'PASSWORD_SCRYPT_P': str(args.p)
+        },
+        'pool': pool_throughput(n, args.r, args.p, args.concurrency, args.verifications)
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Бенчмарк подготовленных запросов на пути verify: запрос sessions JOIN users с разбором и планированием
+на каждый вызов против PREPARE один раз и EXECUTE по имени.
+Сначала сам запрос на одном соединении, затем действие verify целиком (кеш сессий выключен)
+с DB_PREPARED_STATEMENTS=1 и DB_PREPARED_STATEMENTS=0.
+
+Запуск: DATABASE_URL=postgresql://... python backend/benchmarks/prepared_statements.py --calls 5000
+"""
+import argparse
+import json
+import os
+import time
+import psycopg2
+from common import create_user, load_function, make_event, require_database_url, summarize
+
+SESSION_USER_SQL = """
+    SELECT u.id, u.email, u.username, u.energy, u.is_infinite_energy, u.is_admin, s.expires_at
+    FROM sessions s
+    JOIN users u ON s.user_id = u.id
+    WHERE s.session_token = %s AND s.expires_at > CURRENT_TIMESTAMP"""
+
+def timed_calls(calls: int, work) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        work()
+        samples.append(time.perf_counter() - call_started)
+    return summarize(samples, time.perf_counter() - started)
+
+def bench_query(conn, token: str, calls: int) -> dict:
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        def ad_hoc():
+            cur.execute(SESSION_USER_SQL, (token,))
+            cur.fetchone()
+
+        cur.execute("PREPARE bench_session_user AS " + SESSION_USER_SQL.replace('%s', '$1'))
+
+        def prepared():
+            cur.execute("EXECUTE bench_session_user (%s)", (token,))
+            cur.fetchone()
+
+        timed_calls(calls // 10, ad_hoc)
+        timed_calls(calls // 10, prepared)
+        results = {'adHoc': timed_calls(calls, ad_hoc), 'prepared': timed_calls(calls, prepared)}
+        cur.execute("DEALLOCATE bench_session_user")
+    conn.autocommit = False
+    return results
+
+def bench_handler(token: str, calls: int, prepared: bool) -> dict:
+    os.environ['DB_PREPARED_STATEMENTS'] = '1' if prepared else '0'
+    auth = load_function('auth')
+    event = make_event({'action': 'verify', 'token': token})
+
+    def verify():
+        response = auth.handler(event, None)
+        if response['statusCode'] != 200:
+            raise SystemExit(f"verify failed: {response['body']}")
+
+    timed_calls(calls // 10, verify)
+    return timed_calls(calls, verify)
+
+def saving(before: dict, after: dict) -> dict:
+    return {
+        key: {'ms': round(before[key] - after[key], 3),
+              'percent': round((1 - after[key] / before[key]) * 100, 1) if before[key] else 0.0}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms')
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    # Every verify has to reach the database, otherwise the session cache hides the statement cost
+    os.environ['SESSION_CACHE_TTL'] = '0'
+    os.environ['DB_POOL_MIN_SIZE'] = '1'
+    os.environ['DB_POOL_MAX_SIZE'] = '1'
+
+    conn = psycopg2.connect(dsn)
+    try:
+        _, token = create_user(conn)
+        query = bench_query(conn, token, args.calls)
+    finally:
+        conn.close()
+
+    handler = {
+        'adHoc': bench_handler(token, args.calls, prepared=False),
+        'prepared': bench_handler(token, args.calls, prepared=True)
+    }
+    print(json.dumps({
+        'calls': args.calls,
+        'query': {**query, 'saving': saving(query['adHoc'], query['prepared'])},
+        'verifyAction': {**handler, 'saving': saving(handler['adHoc'], handler['prepared'])}
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
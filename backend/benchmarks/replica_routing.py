@@ -0,0 +1,81 @@
+"""
+Маршрутизация чтений на реплику (db.py, DATABASE_URL_REPLICA): проверка и замер на двух локальных PostgreSQL.
+DATABASE_URL — основная база, DATABASE_URL_REPLICA — её потоковая реплика (standby); подойдёт и отдельный
+экземпляр с теми же миграциями — тогда каждая проверка только что созданной сессии пройдёт через повтор на основной базе.
+Сценарии: verify только на основной базе и с репликой (пропускная способность и доля чтений на реплике),
+register и сразу verify (свои записи), недоступная реплика в списке (откат на основную базу без ошибок).
+
+Запуск: DATABASE_URL=postgresql://localhost:5432/app DATABASE_URL_REPLICA=postgresql://localhost:5433/app \\
+        python backend/benchmarks/replica_routing.py --requests 2000
+"""
+import argparse
+import json
+import os
+import secrets
+import time
+import psycopg2
+from common import create_user, load_function, make_event, require_database_url, summarize
+
+UNREACHABLE = 'postgresql://127.0.0.1:1/unreachable'
+
+def bench_verify(token: str, requests: int, replicas: str) -> dict:
+    os.environ['DATABASE_URL_REPLICA'] = replicas
+    auth = load_function('auth')
+    event = make_event({'action': 'verify', 'token': token})
+    samples = []
+    failures = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        call_started = time.perf_counter()
+        if auth.handler(event, None)['statusCode'] != 200:
+            failures += 1
+        samples.append(time.perf_counter() - call_started)
+    return {**summarize(samples, time.perf_counter() - started), 'failures': failures,
+            'routing': dict(auth.routing_stats)}
+
+def check_read_your_writes(attempts: int) -> dict:
+    auth = load_function('auth')
+    verified = 0
+    for _ in range(attempts):
+        suffix = secrets.token_hex(6)
+        response = auth.handler(make_event({
+            'action': 'register', 'email': f'replica-{suffix}@example.com',
+            'username': f'replica-{suffix}', 'password': secrets.token_urlsafe(12)
+        }), None)
+        if response['statusCode'] != 200:
+            raise SystemExit(f"register failed: {response['body']}")
+        token = json.loads(response['body'])['token']
+        if auth.handler(make_event({'action': 'verify', 'token': token}), None)['statusCode'] == 200:
+            verified += 1
+    return {'registered': attempts, 'verifiedImmediately': verified, 'routing': dict(auth.routing_stats)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--registrations', type=int, default=20)
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    replica = os.environ.get('DATABASE_URL_REPLICA')
+    if not replica:
+        raise SystemExit('DATABASE_URL_REPLICA must point to a second PostgreSQL (a standby of DATABASE_URL)')
+    # Every verify has to reach a database, otherwise the session cache hides the routing
+    os.environ['SESSION_CACHE_TTL'] = '0'
+    conn = psycopg2.connect(dsn)
+    try:
+        _, token = create_user(conn)
+    finally:
+        conn.close()
+
+    report = {
+        'requests': args.requests,
+        'primaryOnly': bench_verify(token, args.requests, ''),
+        'withReplica': bench_verify(token, args.requests, replica),
+        'replicaDown': bench_verify(token, args.requests, f'{UNREACHABLE},{replica}')
+    }
+    os.environ['DATABASE_URL_REPLICA'] = replica
+    report['readYourWrites'] = check_read_your_writes(args.registrations)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Поиск пользователей в админке: действие search_users (индексы text_pattern_ops и pg_trgm из V0010)
+против прежнего подхода — выкачать всех пользователей постранично через get_users и искать в браузере.
+Перед замером в базу добавляется --users строк с уникальной меткой прогона; запросы — префиксы и подстроки по email и username.
+
+Запуск: DATABASE_URL=postgresql://... python backend/benchmarks/search_users.py --users 1000000 --calls 200
+        python backend/benchmarks/search_users.py --skip-seed --download-runs 1
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import time
+import psycopg2
+from common import create_user, load_function, make_event, require_database_url, summarize
+
+def seed(conn, users: int) -> str:
+    tag = secrets.token_hex(3)
+    with conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO users (email, username, password_hash, energy)
+               SELECT 'u' || n || '.' || substr(md5(%(tag)s || n), 1, 8) || '@search-' || %(tag)s || '.example.com',
+                      'user_' || substr(md5(n || %(tag)s), 1, 10) || '_' || n,
+                      'bench', (random() * 1000)::int
+               FROM generate_series(1, %(users)s) n""",
+            {'tag': tag, 'users': users}
+        )
+        cur.execute("ANALYZE users")
+    conn.commit()
+    return tag
+
+def sample_queries(conn, count: int, rng: random.Random) -> list:
+    with conn.cursor() as cur:
+        cur.execute("SELECT email, username FROM users TABLESAMPLE SYSTEM (1) LIMIT 1000")
+        rows = cur.fetchall() or [('admin@example.com', 'admin')]
+    conn.rollback()
+    queries = []
+    for _ in range(count):
+        email, username = rng.choice(rows)
+        value = rng.choice((email, username)).lower()
+        kind = rng.choice(('prefix', 'substring', 'short'))
+        if kind == 'prefix':
+            queries.append(value[:rng.randint(3, min(8, len(value)))])
+        elif kind == 'substring':
+            start = rng.randint(1, max(1, len(value) - 5))
+            queries.append(value[start:start + 5])
+        else:
+            queries.append(value[:2])
+    return queries
+
+def call(admin, token: str, body: dict) -> dict:
+    response = admin.handler(make_event(body, {'X-Auth-Token': token}), None)
+    if response['statusCode'] != 200:
+        raise SystemExit(f"{body['action']} failed: {response['body']}")
+    return json.loads(response['body'])
+
+def bench_search(admin, token: str, queries: list, limit: int) -> dict:
+    samples = []
+    found = 0
+    started = time.perf_counter()
+    for query in queries:
+        call_started = time.perf_counter()
+        found += len(call(admin, token, {'action': 'search_users', 'query': query, 'limit': limit})['users'])
+        samples.append(time.perf_counter() - call_started)
+    return {**summarize(samples, time.perf_counter() - started), 'avgResults': round(found / len(queries), 2)}
+
+def bench_download(admin, token: str, queries: list, runs: int) -> dict:
+    samples = []
+    pages = rows = matched = 0
+    started = time.perf_counter()
+    for query in queries[:runs]:
+        call_started = time.perf_counter()
+        users, cursor = [], None
+        while True:
+            body = {'action': 'get_users', 'limit': 500, 'sort': 'id', 'order': 'asc'}
+            if cursor:
+                body['cursor'] = cursor
+            page = call(admin, token, body)
+            users.extend(page['users'])
+            pages += 1
+            cursor = page['nextCursor']
+            if not cursor:
+                break
+        matched = sum(1 for u in users if query in u['email'].lower() or query in u['username'].lower())
+        rows = len(users)
+        samples.append(time.perf_counter() - call_started)
+    return {**summarize(samples, time.perf_counter() - started), 'pagesPerSearch': pages // max(1, len(samples)),
+            'rows': rows, 'lastMatched': matched}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200000, help='rows to add before measuring')
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--download-runs', type=int, default=3, help='full downloads to time; each reads every user')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    dsn = require_database_url()
+    os.environ['SESSION_CACHE_TTL'] = '60'
+    conn = psycopg2.connect(dsn)
+    try:
+        seeded_at = time.perf_counter()
+        tag = None if args.skip_seed else seed(conn, args.users)
+        seed_seconds = time.perf_counter() - seeded_at
+        user_id, token = create_user(conn)
+        with conn.cursor() as cur:
+            cur.execute("UPDATE users SET is_admin = TRUE WHERE id = %s", (user_id,))
+            cur.execute("SELECT COUNT(*) FROM users")
+            total = cur.fetchone()[0]
+        conn.commit()
+        queries = sample_queries(conn, args.calls, random.Random(args.seed))
+    finally:
+        conn.close()
+
+    admin = load_function('admin')
+    call(admin, token, {'action': 'search_users', 'query': queries[0]})
+    print(json.dumps({
+        'users': total,
+        'seedTag': tag,
+        'seedSeconds': round(seed_seconds, 2),
+        'searchUsers': bench_search(admin, token, queries, args.limit),
+        'downloadAndFilter': bench_download(admin, token, queries, args.download_runs)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Пул соединений с PostgreSQL, который переживает тёплые вызовы функции (урезанная копия db.py из auth и admin:
+без реплик, prepared statements и закреплённых соединений — обслуживанию они не нужны).
+Настройки: DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_AGE, DB_POOL_PING_AFTER, DB_POOL_TIMEOUT.
+Драйвер psycopg2 импортируется при первом обращении к базе, а не при холодном старте функции.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+_driver = None
+
+def driver():
+    global _driver
+    if _driver is None:
+        import psycopg2
+        import psycopg2.extensions
+        import psycopg2.errors
+        _driver = psycopg2
+    return _driver
+
+def connection_errors() -> tuple:
+    return (driver().OperationalError, driver().InterfaceError)
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    def __init__(self, dsn: str, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 max_age: float = POOL_MAX_AGE, ping_after: float = POOL_PING_AFTER,
+                 timeout: float = POOL_TIMEOUT):
+        self.dsn = dsn
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        # (connection, created_at, last_used_at)
+        self._idle: List[Tuple[Any, float, float]] = []
+        self._born: Dict[int, float] = {}
+        self._size = 0
+        self.stats = {'connects': 0, 'reuses': 0, 'reconnects': 0, 'discarded': 0}
+
+    def _connect(self):
+        conn = driver().connect(self.dsn)
+        self._born[id(conn)] = time.monotonic()
+        self.stats['connects'] += 1
+        return conn
+
+    def _discard(self, conn) -> None:
+        self._born.pop(id(conn), None)
+        self.stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.max_age > 0 and now - created_at > self.max_age
+
+    def _is_alive(self, conn, last_used_at: float, now: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == driver().extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if now - last_used_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except connection_errors():
+            return False
+
+    def warm(self) -> None:
+        with self._cond:
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        for created in range(missing):
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= missing - created
+                    self._cond.notify_all()
+                raise
+            now = time.monotonic()
+            with self._cond:
+                self._idle.append((conn, now, now))
+                self._cond.notify()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                candidate = self._idle.pop() if self._idle else None
+                if candidate is None and self._size < self.max_size:
+                    self._size += 1
+                    reserve = True
+                else:
+                    reserve = False
+                if candidate is None and not reserve:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout('No database connection available')
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is not None:
+                conn, created_at, last_used_at = candidate
+                now = time.monotonic()
+                if not self._is_expired(created_at, now) and self._is_alive(conn, last_used_at, now):
+                    self.stats['reuses'] += 1
+                    return conn
+                self._discard(conn)
+                self.stats['reconnects'] += 1
+
+            try:
+                return self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+    def putconn(self, conn, broken: bool = False) -> None:
+        now = time.monotonic()
+        created_at = self._born.get(id(conn), now)
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != driver().extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except connection_errors():
+                broken = True
+        keep = not broken and not conn.closed and not self._is_expired(created_at, now)
+        if not keep:
+            self._discard(conn)
+        with self._cond:
+            if keep:
+                self._idle.append((conn, created_at, now))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = isinstance(e, connection_errors())
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(os.environ['DATABASE_URL'])
+                pool.warm()
+                _pool = pool
+    return _pool
+
+def get_db_connection():
+    return get_pool().connection()
@@ -0,0 +1,396 @@
+"""
+Плановое обслуживание базы: удаление истёкших сессий пачками, партиции sessions и energy_transactions
+(новый месяц забирает свои строки из DEFAULT-партиции; меньше MIN_FUTURE_PARTITIONS будущих месяцев — ошибка в отчёте),
+дневные свёртки журнала энергии от водяной метки, сверка балансов users.energy с журналом от контрольной точки, простаивающие корзины общего ограничения попыток входа.
+Свёртки и сверка берут id журнала только до горизонта видимости (energy_ledger_horizon, V0014): id, который ещё может
+закоммитить открытая транзакция, ждёт следующего запуска.
+Запускается таймер-триггером или POST-запросом с заголовком X-Maintenance-Key (переменная MAINTENANCE_KEY).
+"""
+import hmac
+import json
+import os
+import time
+from typing import Dict, Any, Callable, List
+from db import driver, get_db_connection
+from responses import begin_request, configure_cors, header, json_response, preflight_response
+
+configure_cors('POST, OPTIONS', 'Content-Type, X-Maintenance-Key')
+
+MAINTENANCE_KEY = os.environ.get('MAINTENANCE_KEY', '')
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', '1000'))
+MAINTENANCE_TIME_BUDGET = float(os.environ.get('MAINTENANCE_TIME_BUDGET', '20'))
+SESSION_PURGE_GRACE_HOURS = int(os.environ.get('SESSION_PURGE_GRACE_HOURS', '24'))
+SESSION_PARTITIONS_AHEAD_MONTHS = int(os.environ.get('SESSION_PARTITIONS_AHEAD_MONTHS', '3'))
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+# Buckets untouched this long have refilled at any sane rate and carry no state
+LOGIN_THROTTLE_TTL_HOURS = int(os.environ.get('LOGIN_THROTTLE_TTL_HOURS', '1'))
+LOCK_TIMEOUT = os.environ.get('MAINTENANCE_LOCK_TIMEOUT', '2s')
+LEDGER_PARTITIONS_AHEAD_MONTHS = int(os.environ.get('LEDGER_PARTITIONS_AHEAD_MONTHS', '12'))
+# Fewer future months than this means the timer has not run for a while; writes would soon go to the default partition
+MIN_FUTURE_PARTITIONS = 2
+ROLLUP_BATCH_SIZE = int(os.environ.get('ROLLUP_BATCH_SIZE', '50000'))
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '50000'))
+# Off: drift is only reported. On: a 'reconciliation' ledger row explains each drift; users.energy is never rewritten
+RECONCILE_REPAIR = os.environ.get('RECONCILE_REPAIR', '0') == '1'
+RECONCILE_REPORT_LIMIT = int(os.environ.get('RECONCILE_REPORT_LIMIT', '20'))
+
+def purge_in_batches(sql: str, params: tuple, deadline: float) -> Dict[str, Any]:
+    deleted = 0
+    batches = 0
+    complete = False
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            while time.monotonic() < deadline:
+                try:
+                    cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+                    cur.execute(sql, params + (PURGE_BATCH_SIZE,))
+                    batch = cur.rowcount
+                    conn.commit()
+                except driver().errors.LockNotAvailable:
+                    conn.rollback()
+                    break
+                deleted += batch
+                batches += 1
+                if batch < PURGE_BATCH_SIZE:
+                    complete = True
+                    break
+    return {'deleted': deleted, 'batches': batches, 'complete': complete}
+
+def purge_expired_sessions(deadline: float) -> Dict[str, Any]:
+    return purge_in_batches(
+        """WITH doomed AS (
+               SELECT id, expires_at FROM sessions
+               WHERE expires_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+               ORDER BY expires_at
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED
+           )
+           DELETE FROM sessions s USING doomed d
+           WHERE s.id = d.id AND s.expires_at = d.expires_at""",
+        (SESSION_PURGE_GRACE_HOURS,),
+        deadline
+    )
+
+def purge_revoked_sessions(deadline: float) -> Dict[str, Any]:
+    return purge_in_batches(
+        """DELETE FROM revoked_sessions
+           WHERE session_id IN (
+               SELECT session_id FROM revoked_sessions
+               WHERE expires_at < CURRENT_TIMESTAMP
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED
+           )""",
+        (),
+        deadline
+    )
+
+def purge_idempotency_keys(deadline: float) -> Dict[str, Any]:
+    return purge_in_batches(
+        """DELETE FROM energy_idempotency_keys
+           WHERE (user_id, idempotency_key) IN (
+               SELECT user_id, idempotency_key FROM energy_idempotency_keys
+               WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED
+           )""",
+        (IDEMPOTENCY_KEY_TTL_HOURS,),
+        deadline
+    )
+
+def purge_login_throttle(deadline: float) -> Dict[str, Any]:
+    return purge_in_batches(
+        """DELETE FROM login_throttle
+           WHERE key IN (
+               SELECT key FROM login_throttle
+               WHERE updated_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED
+           )""",
+        (LOGIN_THROTTLE_TTL_HOURS,),
+        deadline
+    )
+
+def partition_health(cur, parent: str) -> Dict[str, Any]:
+    cur.execute("SELECT future_partitions, default_rows FROM partition_health(%s)", (parent,))
+    future_partitions, default_rows = cur.fetchone()
+    health = {'futurePartitions': future_partitions, 'defaultRows': default_rows}
+    if future_partitions < MIN_FUTURE_PARTITIONS:
+        health['error'] = f'{parent} has {future_partitions} future partitions, expected at least {MIN_FUTURE_PARTITIONS}'
+    return health
+
+def manage_session_partitions(deadline: float) -> Dict[str, Any]:
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+                cur.execute(
+                    """SELECT sessions_ensure_partitions(
+                           CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::date
+                       )""",
+                    (SESSION_PARTITIONS_AHEAD_MONTHS,)
+                )
+                created = cur.fetchone()[0]
+                cur.execute(
+                    "SELECT sessions_drop_expired_partitions(make_interval(hours => %s))",
+                    (SESSION_PURGE_GRACE_HOURS,)
+                )
+                dropped = cur.fetchone()[0]
+                conn.commit()
+            except driver().errors.LockNotAvailable:
+                conn.rollback()
+                return {'created': 0, 'dropped': 0, 'complete': False, **partition_health(cur, 'sessions')}
+            health = partition_health(cur, 'sessions')
+            conn.rollback()
+    return {'created': created, 'dropped': dropped, 'complete': True, **health}
+
+def manage_ledger_partitions(deadline: float) -> Dict[str, Any]:
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+                cur.execute(
+                    """SELECT ensure_monthly_partitions(
+                           'energy_transactions', CURRENT_DATE,
+                           (CURRENT_DATE + make_interval(months => %s))::date
+                       )""",
+                    (LEDGER_PARTITIONS_AHEAD_MONTHS,)
+                )
+                created = cur.fetchone()[0]
+                conn.commit()
+            except driver().errors.LockNotAvailable:
+                conn.rollback()
+                return {'created': 0, 'complete': False, **partition_health(cur, 'energy_transactions')}
+            health = partition_health(cur, 'energy_transactions')
+            conn.rollback()
+    return {'created': created, 'complete': True, **health}
+
+def advance_ledger_horizon(conn) -> int:
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+            # Read before the snapshot below: whoever took one of these ids already has an xid under its xmax.
+            # The only gap is nextval to the xid assigned by the same INSERT, not a whole transaction.
+            cur.execute(
+                "SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM energy_transactions_id_seq"
+            )
+            allocated = cur.fetchone()[0]
+            # A new statement, so a new snapshot: the pending ids turn safe once no transaction older than
+            # the previous run's snapshot is still open, and the current allocation becomes the next candidate
+            cur.execute(
+                """WITH snap AS (SELECT pg_current_snapshot() AS s)
+                   UPDATE energy_ledger_horizon h
+                   SET safe_id = GREATEST(h.safe_id, h.pending_id),
+                       pending_id = %s,
+                       pending_xmax = pg_snapshot_xmax(snap.s),
+                       updated_at = CURRENT_TIMESTAMP
+                   FROM snap
+                   WHERE pg_snapshot_xmin(snap.s) >= h.pending_xmax
+                   RETURNING h.safe_id""",
+                (allocated,)
+            )
+            row = cur.fetchone()
+            conn.commit()
+            if row is not None:
+                return row[0]
+        except driver().errors.LockNotAvailable:
+            conn.rollback()
+        cur.execute("SELECT safe_id FROM energy_ledger_horizon")
+        safe_id = cur.fetchone()[0]
+        conn.rollback()
+        return safe_id
+
+def rollup_ledger(deadline: float) -> Dict[str, Any]:
+    rolled_up = 0
+    batches = 0
+    complete = False
+    with get_db_connection() as conn:
+        safe_id = advance_ledger_horizon(conn)
+        with conn.cursor() as cur:
+            while time.monotonic() < deadline:
+                try:
+                    cur.execute("SELECT last_id FROM energy_rollup_watermark FOR UPDATE NOWAIT")
+                except driver().errors.LockNotAvailable:
+                    conn.rollback()
+                    break
+                last_id = cur.fetchone()[0]
+                upto = min(last_id + ROLLUP_BATCH_SIZE, safe_id)
+                if upto <= last_id:
+                    conn.rollback()
+                    complete = True
+                    break
+                cur.execute(
+                    """INSERT INTO energy_transactions_daily (day, transaction_type, count, total)
+                       SELECT created_at::date, transaction_type, COUNT(*), SUM(amount)
+                       FROM energy_transactions
+                       WHERE id > %s AND id <= %s
+                       GROUP BY created_at::date, transaction_type
+                       ON CONFLICT (day, transaction_type) DO UPDATE
+                       SET count = energy_transactions_daily.count + EXCLUDED.count,
+                           total = energy_transactions_daily.total + EXCLUDED.total""",
+                    (last_id, upto)
+                )
+                cur.execute(
+                    "UPDATE energy_rollup_watermark SET last_id = %s, updated_at = CURRENT_TIMESTAMP",
+                    (upto,)
+                )
+                conn.commit()
+                rolled_up += upto - last_id
+                batches += 1
+    return {'idsRolledUp': rolled_up, 'batches': batches, 'complete': complete}
+
+# One id range of the ledger, in one snapshot: ledger rows after the range (and the users.energy changes they made)
+# are added as the tail, so the comparison holds even while the job lags behind. users is only read, never locked.
+RECONCILE_BATCH = """
+    WITH batch AS (
+        SELECT user_id, SUM(amount)::bigint AS amount, COUNT(*) AS rows
+        FROM energy_transactions
+        WHERE id > %(last_id)s AND id <= %(upto)s
+        GROUP BY user_id
+    ),
+    tail AS (
+        SELECT user_id, SUM(amount)::bigint AS amount
+        FROM energy_transactions
+        WHERE id > %(upto)s AND user_id IN (SELECT user_id FROM batch)
+        GROUP BY user_id
+    ),
+    current AS (
+        SELECT b.user_id, u.energy, u.is_infinite_energy, COALESCE(t.amount, 0) AS tail,
+               COALESCE(eb.ledger_total, 0) + b.amount AS ledger_total,
+               COALESCE(eb.opening, CASE WHEN b.user_id <= %(opening_user_id)s
+                                         THEN u.energy - COALESCE(eb.ledger_total, 0) - b.amount - COALESCE(t.amount, 0)
+                                         ELSE 0 END) AS opening
+        FROM batch b
+        JOIN users u ON u.id = b.user_id
+        LEFT JOIN tail t ON t.user_id = b.user_id
+        LEFT JOIN energy_balances eb ON eb.user_id = b.user_id
+    ),
+    checked AS (
+        INSERT INTO energy_balances AS eb (user_id, opening, ledger_total, drift, checked_at)
+        SELECT user_id, opening, ledger_total,
+               CASE WHEN is_infinite_energy THEN 0 ELSE energy - opening - ledger_total - tail END,
+               CURRENT_TIMESTAMP
+        FROM current
+        ON CONFLICT (user_id) DO UPDATE
+        SET opening = EXCLUDED.opening, ledger_total = EXCLUDED.ledger_total,
+            drift = EXCLUDED.drift, checked_at = EXCLUDED.checked_at
+        RETURNING user_id, drift
+    ),
+    repaired AS (
+        INSERT INTO energy_transactions (user_id, amount, transaction_type, description)
+        SELECT user_id, drift, 'reconciliation', 'Ledger reconciliation: ' || drift
+        FROM checked
+        WHERE %(repair)s AND drift <> 0
+        RETURNING 1
+    )
+    SELECT (SELECT COALESCE(SUM(rows), 0) FROM batch) AS rows,
+           (SELECT COUNT(*) FROM checked) AS users,
+           (SELECT COUNT(*) FROM checked WHERE drift <> 0) AS drifted,
+           (SELECT COUNT(*) FROM repaired) AS repaired"""
+
+def reconcile_ledger(deadline: float) -> Dict[str, Any]:
+    totals = {'rows': 0, 'users': 0, 'drifted': 0, 'repaired': 0}
+    batches = 0
+    complete = False
+    started = time.monotonic()
+    with get_db_connection() as conn:
+        safe_id = advance_ledger_horizon(conn)
+        with conn.cursor() as cur:
+            while time.monotonic() < deadline:
+                try:
+                    cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+                    cur.execute(
+                        "SELECT last_id, opening_user_id FROM energy_reconcile_checkpoint FOR UPDATE NOWAIT"
+                    )
+                    last_id, opening_user_id = cur.fetchone()
+                    upto = min(last_id + RECONCILE_BATCH_SIZE, safe_id)
+                    if upto <= last_id:
+                        conn.rollback()
+                        complete = True
+                        break
+                    cur.execute(RECONCILE_BATCH, {
+                        'last_id': last_id, 'upto': upto, 'opening_user_id': opening_user_id, 'repair': RECONCILE_REPAIR
+                    })
+                    rows, users, drifted, repaired = cur.fetchone()
+                    cur.execute(
+                        "UPDATE energy_reconcile_checkpoint SET last_id = %s, updated_at = CURRENT_TIMESTAMP",
+                        (upto,)
+                    )
+                    conn.commit()
+                except driver().errors.LockNotAvailable:
+                    conn.rollback()
+                    break
+                for key, value in (('rows', rows), ('users', users), ('drifted', drifted), ('repaired', repaired)):
+                    totals[key] += int(value)
+                batches += 1
+            
+            cur.execute(
+                """SELECT user_id, drift FROM energy_balances WHERE drift <> 0
+                   ORDER BY abs(drift) DESC, user_id LIMIT %s""",
+                (RECONCILE_REPORT_LIMIT,)
+            )
+            worst = [{'userId': user_id, 'drift': drift} for user_id, drift in cur.fetchall()]
+            cur.execute("SELECT COUNT(*) FROM energy_balances WHERE drift <> 0")
+            drifted_users = cur.fetchone()[0]
+            conn.rollback()
+    elapsed = time.monotonic() - started
+    return {
+        **totals,
+        'batches': batches,
+        'complete': complete,
+        'rowsPerSecond': round(totals['rows'] / elapsed) if elapsed > 0 else 0,
+        'repair': RECONCILE_REPAIR,
+        'driftedUsers': drifted_users,
+        'worstDrift': worst
+    }
+
+# Partition maintenance goes first: dropping a whole month is cheaper than deleting its rows
+TASKS: Dict[str, Callable[[float], Dict[str, Any]]] = {
+    'session_partitions': manage_session_partitions,
+    'ledger_partitions': manage_ledger_partitions,
+    'ledger_rollup': rollup_ledger,
+    'ledger_reconcile': reconcile_ledger,
+    'purge_sessions': purge_expired_sessions,
+    'purge_revoked_sessions': purge_revoked_sessions,
+    'purge_idempotency_keys': purge_idempotency_keys,
+    'purge_login_throttle': purge_login_throttle
+}
+
+def run_tasks(names: List[str]) -> Dict[str, Any]:
+    deadline = time.monotonic() + MAINTENANCE_TIME_BUDGET
+    results = {}
+    for name in names:
+        started = time.monotonic()
+        results[name] = TASKS[name](deadline)
+        results[name]['seconds'] = round(time.monotonic() - started, 3)
+    return results
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method = event.get('httpMethod')
+
+    if method == 'OPTIONS':
+        return preflight_response()
+
+    begin_request(event)
+
+    try:
+        names = list(TASKS)
+
+        # HTTP calls must present the key; timer triggers arrive without httpMethod
+        if method is not None:
+            key = header(event, 'X-Maintenance-Key')
+            if not MAINTENANCE_KEY or not hmac.compare_digest(key, MAINTENANCE_KEY):
+                return json_response(403, {'error': 'Maintenance key required'})
+            body_data = json.loads(event.get('body') or '{}')
+            names = body_data.get('tasks') or names
+            unknown = [n for n in names if n not in TASKS]
+            if unknown:
+                return json_response(400, {'error': f"Unknown tasks: {', '.join(unknown)}"})
+
+        results = run_tasks(names)
+        # A failing status is what makes a timer run show up in monitoring
+        errors = [result['error'] for result in results.values() if 'error' in result]
+        if errors:
+            return json_response(500, {'error': '; '.join(errors), 'results': results})
+        return json_response(200, {'results': results})
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
@@ -3,35 +3,23 @@
 """
 import json
 import os
-import hashlib
 from typing import Dict, Any
-import psycopg2
+from passwords import hash_password
+from responses import begin_request, configure_cors, json_response, preflight_response
+
+configure_cors('GET, POST, OPTIONS', 'Content-Type')
 
 def get_db_connection():
+    import psycopg2
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def cors_headers() -> Dict[str, str]:
-    return {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type',
-        'Access-Control-Max-Age': '86400'
-    }
-
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': cors_headers(),
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight_response()
+    
+    begin_request(event)
     
     if method == 'POST':
         try:
@@ -50,33 +38,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     )
                     conn.commit()
                     
-                    return {
-                        'statusCode': 200,
-                        'headers': cors_headers(),
-                        'body': json.dumps({
-                            'success': True,
-                            'email': email,
-                            'hash': password_hash,
-                            'message': 'Password updated successfully'
-                        }),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(200, {
+                        'success': True,
+                        'email': email,
+                        'hash': password_hash,
+                        'message': 'Password updated successfully'
+                    })
             finally:
                 conn.close()
         except Exception as e:
-            return {
-                'statusCode': 500,
-                'headers': cors_headers(),
-                'body': json.dumps({'error': str(e)}),
-                'isBase64Encoded': False
-            }
+            return json_response(500, {'error': str(e)})
     
-    return {
-        'statusCode': 200,
-        'headers': cors_headers(),
-        'body': json.dumps({
-            'message': 'Admin setup utility',
-            'usage': 'POST with {"password": "yourpassword", "email": "user@example.com"}'
-        }),
-        'isBase64Encoded': False
-    }
+    return json_response(200, {
+        'message': 'Admin setup utility',
+        'usage': 'POST with {"password": "yourpassword", "email": "user@example.com"}'
+    })
@@ -0,0 +1,192 @@
+"""
+Общий слой ответов функции: CORS-заголовки и preflight-ответ собираются один раз при импорте,
+тёплый путь только сериализует тело.
+Сериализация через orjson, если он установлен (иначе стандартный json); datetime/date/Decimal
+кодируются самим сериализатором. orjson подключается, только когда стандартный json впервые потратит на тело
+больше RESPONSE_ORJSON_AFTER_MS: его импорт дороже, чем он экономит на мелких ответах холодного старта. Тело больше RESPONSE_GZIP_MIN_BYTES сжимается gzip и отдаётся
+в base64, если клиент прислал Accept-Encoding: gzip. Время сериализации и сжатия пишется в timing.py, если он есть.
+Внутри collecting_payloads() json_response не сериализует тело, а возвращает payload — так пакет (batch.py)
+собирает ответы действий и кодирует их один раз. text_response отдаёт готовое тело (CSV, NDJSON) тем же путём сжатия.
+Условные чтения: begin_request запоминает If-None-Match, etag_matches сравнивает его с ETag действия,
+not_modified_response отдаёт 304 без тела. В пакете заголовок запроса не действует — у элемента своё поле ifNoneMatch.
+"""
+import base64
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    from timing import record
+except ImportError:
+    record = None
+
+GZIP_MIN_BYTES = int(os.environ.get('RESPONSE_GZIP_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '5'))
+ORJSON_AFTER_MS = float(os.environ.get('RESPONSE_ORJSON_AFTER_MS', '1'))
+
+CORS_HEADERS: Dict[str, str] = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
+    'Access-Control-Expose-Headers': 'ETag, X-Next-Cursor, X-Row-Count',
+    'Access-Control-Max-Age': '86400'
+}
+
+# Every body that could be gzipped varies by Accept-Encoding, whether or not this client got it compressed
+VARY_HEADERS: Dict[str, str] = {'Vary': 'Accept-Encoding'}
+GZIP_HEADERS: Dict[str, str] = {'Content-Encoding': 'gzip', **VARY_HEADERS}
+
+PREFLIGHT_RESPONSE: Dict[str, Any] = {
+    'statusCode': 200,
+    'headers': CORS_HEADERS,
+    'body': '',
+    'isBase64Encoded': False
+}
+
+_accepts_gzip: contextvars.ContextVar = contextvars.ContextVar('accepts_gzip', default=False)
+_collecting: contextvars.ContextVar = contextvars.ContextVar('collecting_payloads', default=False)
+_if_none_match: contextvars.ContextVar = contextvars.ContextVar('if_none_match', default='')
+
+def configure_cors(allow_methods: str, allow_headers: str) -> None:
+    CORS_HEADERS['Access-Control-Allow-Methods'] = allow_methods
+    CORS_HEADERS['Access-Control-Allow-Headers'] = allow_headers
+
+def cors_headers() -> Dict[str, str]:
+    return CORS_HEADERS
+
+def preflight_response() -> Dict[str, Any]:
+    return PREFLIGHT_RESPONSE
+
+def header(event: Dict[str, Any], name: str) -> str:
+    headers = event.get('headers') or {}
+    value = headers.get(name)
+    if value is None:
+        lowered = name.lower()
+        for key, candidate in headers.items():
+            if key.lower() == lowered:
+                return candidate
+        return ''
+    return value
+
+def begin_request(event: Dict[str, Any]) -> None:
+    accepted = False
+    for part in header(event, 'Accept-Encoding').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            accepted = params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+            break
+    _accepts_gzip.set(accepted)
+    _if_none_match.set(header(event, 'If-None-Match'))
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # gzip and decimal are imported where first needed to keep them off the cold-start path
+    from decimal import Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def _stdlib_dumps(payload: Any) -> bytes:
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode()
+
+def _load_orjson() -> Callable[[Any], bytes]:
+    try:
+        import orjson
+    except ImportError:
+        return _stdlib_dumps
+    return lambda payload: orjson.dumps(payload, default=_default)
+
+_encoder: Optional[Callable[[Any], bytes]] = None
+
+def dumps(payload: Any) -> bytes:
+    global _encoder
+    if _encoder is not None:
+        return _encoder(payload)
+    started = time.perf_counter()
+    body = _stdlib_dumps(payload)
+    # orjson pulls in uuid, zoneinfo and enum; only a body that is slow to encode is worth that import
+    if (time.perf_counter() - started) * 1000 >= ORJSON_AFTER_MS:
+        _encoder = _load_orjson()
+    return body
+
+@contextmanager
+def collecting_payloads() -> Iterator[None]:
+    token = _collecting.set(True)
+    condition = _if_none_match.set('')
+    try:
+        yield
+    finally:
+        _if_none_match.reset(condition)
+        _collecting.reset(token)
+
+def etag_matches(etag: str, if_none_match: Optional[str] = None) -> bool:
+    value = _if_none_match.get() if if_none_match is None else if_none_match
+    if not isinstance(value, str) or not value:
+        return False
+    if value.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison: W/"x" and "x" are the same tag
+    wanted = etag[2:] if etag.startswith('W/') else etag
+    for candidate in value.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == wanted:
+            return True
+    return False
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    if _collecting.get():
+        return {'statusCode': 304, 'headers': {'ETag': etag}, 'payload': None}
+    return {
+        'statusCode': 304,
+        'headers': {**CORS_HEADERS, 'ETag': etag},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def json_response(status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    if _collecting.get():
+        return {'statusCode': status, 'headers': headers or {}, 'payload': payload}
+    started = time.perf_counter()
+    body = dumps(payload)
+    if record is not None:
+        record('serialize', time.perf_counter() - started)
+    return _encoded_response(status, body, headers)
+
+def text_response(status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    headers = {'Content-Type': content_type, **(headers or {})}
+    if _collecting.get():
+        return {'statusCode': status, 'headers': headers, 'payload': body.decode()}
+    return _encoded_response(status, body, headers)
+
+def _encoded_response(status: int, body: bytes, headers: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    if len(body) < GZIP_MIN_BYTES:
+        return {
+            'statusCode': status,
+            'headers': CORS_HEADERS if headers is None else {**CORS_HEADERS, **headers},
+            'body': body.decode(),
+            'isBase64Encoded': False
+        }
+    if _accepts_gzip.get():
+        import gzip
+        started = time.perf_counter()
+        compressed = base64.b64encode(gzip.compress(body, compresslevel=GZIP_LEVEL)).decode()
+        if record is not None:
+            record('gzip', time.perf_counter() - started)
+        return {
+            'statusCode': status,
+            'headers': {**CORS_HEADERS, **GZIP_HEADERS, **(headers or {})},
+            'body': compressed,
+            'isBase64Encoded': True
+        }
+    return {
+        'statusCode': status,
+        'headers': {**CORS_HEADERS, **VARY_HEADERS, **(headers or {})},
+        'body': body.decode(),
+        'isBase64Encoded': False
+    }
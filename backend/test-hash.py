@@ -1,6 +1,14 @@
 import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'auth'))
+from passwords import hash_password, verify_password
 
 password = "woy228228"
-hash_result = hashlib.sha256(password.encode()).hexdigest()
+legacy_hash = hashlib.sha256(password.encode()).hexdigest()
+kdf_hash = hash_password(password)
 print(f"Password: {password}")
-print(f"Hash: {hash_result}")
+print(f"Legacy hash: {legacy_hash}")
+print(f"Hash: {kdf_hash}")
+print(f"Verify: {verify_password(password, kdf_hash)}, legacy verify (ok, needs rehash): {verify_password(password, legacy_hash)}")
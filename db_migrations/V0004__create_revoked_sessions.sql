@@ -0,0 +1,11 @@
+-- Revocation list for signed (stateless) session tokens.
+-- Verify checks the signature and expiry locally; logout records the session id here,
+-- and every function instance reloads new rows in bulk (by revoked_at) every few seconds.
+CREATE TABLE IF NOT EXISTS revoked_sessions (
+    session_id VARCHAR(64) PRIMARY KEY,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_sessions_revoked_at ON revoked_sessions(revoked_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_sessions_expires_at ON revoked_sessions(expires_at);
@@ -0,0 +1,10 @@
+-- Indexes backing keyset pagination of the admin user list.
+-- Each sortable column is indexed together with id, so one page is a bounded index range scan
+-- that continues from (sort_key, id) of the previous page instead of an OFFSET.
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_users_last_login_id ON users((COALESCE(last_login, '-infinity'::timestamp)), id);
+CREATE INDEX IF NOT EXISTS idx_users_energy_id ON users(energy, id);
+
+-- Rare flags: partial indexes keep "only admins" / "only infinite energy" pages index-only in size
+CREATE INDEX IF NOT EXISTS idx_users_admins_created_at_id ON users(created_at, id) WHERE is_admin;
+CREATE INDEX IF NOT EXISTS idx_users_infinite_created_at_id ON users(created_at, id) WHERE is_infinite_energy;
@@ -0,0 +1,119 @@
+-- Incrementally maintained counters for the admin statistics endpoint.
+-- Statement-level triggers fold every write into sharded counter rows inside the same transaction,
+-- so get_stats sums a handful of rows instead of scanning users and energy_transactions.
+-- The shard is picked by backend pid, which keeps concurrent writers off a single hot row.
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name VARCHAR(50) NOT NULL,
+    shard SMALLINT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+CREATE TABLE IF NOT EXISTS stats_transaction_totals (
+    transaction_type VARCHAR(50) NOT NULL,
+    shard SMALLINT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (transaction_type, shard)
+);
+
+-- Time-dependent numbers (active sessions) are recomputed periodically and stamped with computed_at
+CREATE TABLE IF NOT EXISTS stats_snapshots (
+    name VARCHAR(50) PRIMARY KEY,
+    value BIGINT NOT NULL,
+    computed_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+
+CREATE OR REPLACE FUNCTION stats_bump(counter VARCHAR, delta BIGINT) RETURNS void AS $$
+BEGIN
+    IF delta <> 0 THEN
+        INSERT INTO stats_counters (name, shard, value)
+        VALUES (counter, pg_backend_pid() % 16, delta)
+        ON CONFLICT (name, shard) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_users_apply() RETURNS trigger AS $$
+DECLARE
+    added_users BIGINT := 0;
+    added_finite BIGINT := 0;
+    added_energy BIGINT := 0;
+    removed_users BIGINT := 0;
+    removed_finite BIGINT := 0;
+    removed_energy BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE NOT is_infinite_energy),
+               COALESCE(SUM(energy) FILTER (WHERE NOT is_infinite_energy), 0)
+        INTO added_users, added_finite, added_energy
+        FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE NOT is_infinite_energy),
+               COALESCE(SUM(energy) FILTER (WHERE NOT is_infinite_energy), 0)
+        INTO removed_users, removed_finite, removed_energy
+        FROM old_rows;
+    END IF;
+    PERFORM stats_bump('total_users', added_users - removed_users);
+    PERFORM stats_bump('finite_users', added_finite - removed_finite);
+    PERFORM stats_bump('finite_energy', added_energy - removed_energy);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stats_users_insert ON users;
+CREATE TRIGGER trg_stats_users_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_users_apply();
+
+DROP TRIGGER IF EXISTS trg_stats_users_update ON users;
+CREATE TRIGGER trg_stats_users_update AFTER UPDATE ON users
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_users_apply();
+
+DROP TRIGGER IF EXISTS trg_stats_users_delete ON users;
+CREATE TRIGGER trg_stats_users_delete AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_users_apply();
+
+CREATE OR REPLACE FUNCTION stats_transactions_apply() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_transaction_totals (transaction_type, shard, count, total)
+    SELECT transaction_type, pg_backend_pid() % 16, COUNT(*), SUM(amount)
+    FROM new_rows
+    GROUP BY transaction_type
+    ON CONFLICT (transaction_type, shard) DO UPDATE
+    SET count = stats_transaction_totals.count + EXCLUDED.count,
+        total = stats_transaction_totals.total + EXCLUDED.total;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stats_energy_transactions_insert ON energy_transactions;
+CREATE TRIGGER trg_stats_energy_transactions_insert AFTER INSERT ON energy_transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_transactions_apply();
+
+-- Rebuilds every counter from the base tables; also used to seed them here
+CREATE OR REPLACE FUNCTION stats_rebuild() RETURNS void AS $$
+BEGIN
+    LOCK TABLE users, energy_transactions IN SHARE MODE;
+    DELETE FROM stats_counters;
+    INSERT INTO stats_counters (name, shard, value)
+    SELECT 'total_users', 0, COUNT(*) FROM users
+    UNION ALL
+    SELECT 'finite_users', 0, COUNT(*) FROM users WHERE NOT is_infinite_energy
+    UNION ALL
+    SELECT 'finite_energy', 0, COALESCE(SUM(energy), 0) FROM users WHERE NOT is_infinite_energy;
+    DELETE FROM stats_transaction_totals;
+    INSERT INTO stats_transaction_totals (transaction_type, shard, count, total)
+    SELECT transaction_type, 0, COUNT(*), SUM(amount) FROM energy_transactions GROUP BY transaction_type;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT stats_rebuild();
@@ -0,0 +1,11 @@
+-- Idempotency keys for the user-facing consume_energy action.
+-- The key is claimed in the same statement that debits users.energy and writes the ledger row,
+-- so a retried request with the same key is never charged twice. Old keys are purged by maintenance.
+CREATE TABLE IF NOT EXISTS energy_idempotency_keys (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    idempotency_key VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_energy_idempotency_keys_created_at ON energy_idempotency_keys(created_at);
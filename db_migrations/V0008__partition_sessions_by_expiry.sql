@@ -0,0 +1,88 @@
+-- Range-partition sessions by expires_at (one partition per month).
+-- Expired months are dropped whole by the maintenance function instead of being deleted row by row;
+-- verify queries filter on expires_at > CURRENT_TIMESTAMP, so old partitions are pruned at execution time.
+-- A unique index on a partitioned table must contain the partition key, so session_token is
+-- unique per (session_token, expires_at); tokens are 256-bit random or signed values.
+
+CREATE OR REPLACE FUNCTION sessions_partition_name(month_start DATE) RETURNS TEXT AS $$
+    SELECT 'sessions_p' || to_char(month_start, 'YYYYMM');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION sessions_ensure_partitions(from_month DATE, to_month DATE) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= to_month LOOP
+        IF to_regclass(sessions_partition_name(month_start)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF sessions FOR VALUES FROM (%L) TO (%L)',
+                sessions_partition_name(month_start),
+                month_start,
+                (month_start + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drops partitions whose whole range expired more than `grace` ago; returns the number dropped
+CREATE OR REPLACE FUNCTION sessions_drop_expired_partitions(grace INTERVAL) RETURNS INTEGER AS $$
+DECLARE
+    expired RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    FOR expired IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sessions'::regclass
+          AND c.relname ~ '^sessions_p[0-9]{6}$'
+          AND to_date(substring(c.relname FROM 11), 'YYYYMM') + INTERVAL '1 month' + grace < CURRENT_TIMESTAMP
+    LOOP
+        EXECUTE format('DROP TABLE %I', expired.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE sessions RENAME TO sessions_legacy;
+ALTER INDEX IF EXISTS idx_sessions_token RENAME TO idx_sessions_legacy_token;
+ALTER INDEX IF EXISTS idx_sessions_user_id RENAME TO idx_sessions_legacy_user_id;
+ALTER INDEX IF EXISTS idx_sessions_expires_at RENAME TO idx_sessions_legacy_expires_at;
+
+CREATE TABLE sessions (
+    id INTEGER NOT NULL DEFAULT nextval('sessions_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    session_token VARCHAR(255) NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, expires_at),
+    UNIQUE (session_token, expires_at)
+) PARTITION BY RANGE (expires_at);
+
+ALTER SEQUENCE sessions_id_seq OWNED BY sessions.id;
+
+CREATE INDEX IF NOT EXISTS idx_sessions_token ON sessions(session_token);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+
+SELECT sessions_ensure_partitions(
+    LEAST(CURRENT_DATE, COALESCE((SELECT MIN(expires_at)::date FROM sessions_legacy WHERE expires_at > CURRENT_TIMESTAMP), CURRENT_DATE)),
+    GREATEST(
+        (CURRENT_DATE + INTERVAL '3 months')::date,
+        COALESCE((SELECT MAX(expires_at)::date FROM sessions_legacy), CURRENT_DATE)
+    )
+);
+
+-- Only live sessions move over; everything else was already unusable
+INSERT INTO sessions (id, user_id, session_token, expires_at, created_at)
+SELECT id, user_id, session_token, expires_at, created_at
+FROM sessions_legacy
+WHERE expires_at > CURRENT_TIMESTAMP;
+
+DROP TABLE sessions_legacy;
@@ -0,0 +1,100 @@
+-- Monthly range partitions for the append-only energy ledger and a daily rollup fed from an id watermark.
+-- Admin statistics and time series read energy_transactions_daily (plus the short not-yet-rolled-up tail)
+-- instead of grouping the whole ledger.
+
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent TEXT, from_month DATE, to_month DATE) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= to_month LOOP
+        partition_name := parent || '_p' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, (month_start + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+LOCK TABLE energy_transactions IN EXCLUSIVE MODE;
+
+ALTER TABLE energy_transactions RENAME TO energy_transactions_legacy;
+ALTER INDEX IF EXISTS idx_energy_transactions_user_id RENAME TO idx_energy_transactions_legacy_user_id;
+
+CREATE TABLE energy_transactions (
+    id INTEGER NOT NULL DEFAULT nextval('energy_transactions_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    amount INTEGER NOT NULL,
+    transaction_type VARCHAR(50) NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE energy_transactions_id_seq OWNED BY energy_transactions.id;
+
+CREATE INDEX IF NOT EXISTS idx_energy_transactions_user_id ON energy_transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_energy_transactions_id ON energy_transactions(id);
+
+-- The ledger is never dropped, so partitions are created a year ahead; maintenance keeps extending them
+SELECT ensure_monthly_partitions(
+    'energy_transactions',
+    COALESCE((SELECT MIN(created_at)::date FROM energy_transactions_legacy), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '12 months')::date
+);
+
+INSERT INTO energy_transactions (id, user_id, amount, transaction_type, description, created_at)
+SELECT id, user_id, amount, transaction_type, description, created_at
+FROM energy_transactions_legacy;
+
+DROP TABLE energy_transactions_legacy;
+
+-- Replaced by the daily rollups below
+DROP FUNCTION IF EXISTS stats_transactions_apply() CASCADE;
+DROP TABLE IF EXISTS stats_transaction_totals;
+
+CREATE OR REPLACE FUNCTION stats_rebuild() RETURNS void AS $$
+BEGIN
+    LOCK TABLE users IN SHARE MODE;
+    DELETE FROM stats_counters;
+    INSERT INTO stats_counters (name, shard, value)
+    SELECT 'total_users', 0, COUNT(*) FROM users
+    UNION ALL
+    SELECT 'finite_users', 0, COUNT(*) FROM users WHERE NOT is_infinite_energy
+    UNION ALL
+    SELECT 'finite_energy', 0, COALESCE(SUM(energy), 0) FROM users WHERE NOT is_infinite_energy;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS energy_transactions_daily (
+    day DATE NOT NULL,
+    transaction_type VARCHAR(50) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, transaction_type)
+);
+
+-- Single row: every ledger id <= last_id is already folded into energy_transactions_daily
+CREATE TABLE IF NOT EXISTS energy_rollup_watermark (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    last_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO energy_transactions_daily (day, transaction_type, count, total)
+SELECT created_at::date, transaction_type, COUNT(*), SUM(amount)
+FROM energy_transactions
+GROUP BY created_at::date, transaction_type
+ON CONFLICT (day, transaction_type) DO UPDATE
+SET count = EXCLUDED.count, total = EXCLUDED.total;
+
+INSERT INTO energy_rollup_watermark (id, last_id)
+VALUES (TRUE, COALESCE((SELECT MAX(id) FROM energy_transactions), 0))
+ON CONFLICT (id) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = CURRENT_TIMESTAMP;
@@ -0,0 +1,12 @@
+-- Indexes backing the admin search_users action: case-insensitive prefix and substring search on email and username.
+-- Prefix matches (lower(col) LIKE 'abc%') are btree range scans on text_pattern_ops. The LIKE range works in any
+-- collation, but the index only yields rows in byte order: queries must sort with ORDER BY lower(col) USING ~<~
+-- to stop at their LIMIT, a plain ORDER BY lower(col) sorts every row sharing the prefix first;
+-- substring matches (lower(col) LIKE '%abc%', three or more characters) use trigram GIN indexes.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_users_email_lower_prefix ON users(lower(email) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_username_lower_prefix ON users(lower(username) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_users_email_lower_trgm ON users USING gin (lower(email) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_username_lower_trgm ON users USING gin (lower(username) gin_trgm_ops);
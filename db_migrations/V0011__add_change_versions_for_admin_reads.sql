@@ -0,0 +1,31 @@
+-- Change counters behind the ETags of admin get_stats and get_users.
+-- Every statement that writes users or the energy ledger bumps version_users / version_ledger in the sharded
+-- stats_counters table, so a poll compares a handful of counter rows instead of rebuilding the payload.
+CREATE OR REPLACE FUNCTION stats_bump_version() RETURNS trigger AS $$
+BEGIN
+    PERFORM stats_bump('version_' || TG_ARGV[0], 1);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_version_users ON users;
+CREATE TRIGGER trg_version_users AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_bump_version('users');
+
+DROP TRIGGER IF EXISTS trg_version_ledger ON energy_transactions;
+CREATE TRIGGER trg_version_ledger AFTER INSERT OR UPDATE OR DELETE ON energy_transactions
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_bump_version('ledger');
+
+-- A rebuild must not reset the versions, or an old ETag could match again
+CREATE OR REPLACE FUNCTION stats_rebuild() RETURNS void AS $$
+BEGIN
+    LOCK TABLE users IN SHARE MODE;
+    DELETE FROM stats_counters WHERE name NOT LIKE 'version\_%';
+    INSERT INTO stats_counters (name, shard, value)
+    SELECT 'total_users', 0, COUNT(*) FROM users
+    UNION ALL
+    SELECT 'finite_users', 0, COUNT(*) FROM users WHERE NOT is_infinite_energy
+    UNION ALL
+    SELECT 'finite_energy', 0, COALESCE(SUM(energy), 0) FROM users WHERE NOT is_infinite_energy;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,11 @@
+-- Shared token buckets for login and password-change attempts (auth throttle.py, LOGIN_THROTTLE_SHARED=1).
+-- A row is one bucket keyed by 'email:<address>' or 'ip:<address>'; tokens refill at rate per second
+-- and are recomputed on every attempt, so idle rows only need an occasional purge by the maintenance job.
+CREATE TABLE IF NOT EXISTS login_throttle (
+    key VARCHAR(320) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    rate DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_throttle_updated_at ON login_throttle(updated_at);
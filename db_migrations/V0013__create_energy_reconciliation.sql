@@ -0,0 +1,25 @@
+-- Ledger reconciliation (maintenance task ledger_reconcile): per-user running ledger totals, checked against
+-- users.energy as new ledger rows arrive. Every ledger id <= last_id is already folded into energy_balances.
+CREATE TABLE IF NOT EXISTS energy_reconcile_checkpoint (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    last_id INTEGER NOT NULL DEFAULT 0,
+    -- Users up to this id predate registration ledger rows; their unexplained balance becomes an opening balance
+    opening_user_id INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO energy_reconcile_checkpoint (id, last_id, opening_user_id)
+VALUES (TRUE, 0, COALESCE((SELECT MAX(id) FROM users), 0))
+ON CONFLICT (id) DO NOTHING;
+
+-- drift = users.energy - (opening + ledger_total + newer ledger rows) at checked_at; 0 for infinite-energy users
+CREATE TABLE IF NOT EXISTS energy_balances (
+    -- No foreign key: inserting here must not take key-share locks on live users rows
+    user_id INTEGER PRIMARY KEY,
+    opening BIGINT NOT NULL DEFAULT 0,
+    ledger_total BIGINT NOT NULL DEFAULT 0,
+    drift BIGINT NOT NULL DEFAULT 0,
+    checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_energy_balances_drift ON energy_balances(user_id) WHERE drift <> 0;
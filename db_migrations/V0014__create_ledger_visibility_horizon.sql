@@ -0,0 +1,15 @@
+-- Visibility horizon for the id-range ledger jobs (ledger_rollup, ledger_reconcile). Ledger ids come from a sequence
+-- but become visible at commit, so a row can appear below ids that are already visible. An id is safe to fold
+-- only once every transaction that could still commit it has ended.
+CREATE TABLE IF NOT EXISTS energy_ledger_horizon (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    -- Every ledger id <= safe_id is committed or rolled back for good
+    safe_id INTEGER NOT NULL DEFAULT 0,
+    -- Ids allocated up to pending_id, read before a snapshot with xmax pending_xmax; they become safe
+    -- as soon as a later snapshot's xmin reaches pending_xmax, i.e. every older transaction has ended
+    pending_id INTEGER NOT NULL DEFAULT 0,
+    pending_xmax xid8 NOT NULL DEFAULT '0',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO energy_ledger_horizon (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,63 @@
+-- DEFAULT partitions for sessions and energy_transactions: if the maintenance timer stops and the pre-created
+-- months run out, logins, registrations and ledger writes land here instead of failing with
+-- "no partition of relation found". Creating a month later moves its rows out of the default partition.
+
+CREATE TABLE IF NOT EXISTS sessions_default PARTITION OF sessions DEFAULT;
+CREATE TABLE IF NOT EXISTS energy_transactions_default PARTITION OF energy_transactions DEFAULT;
+
+-- A month partition cannot be created while the default partition holds rows in its range, so the month is built
+-- as a plain table, the rows are moved into it and it is attached. parent_default is the parent's DEFAULT partition.
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent TEXT, from_month DATE, to_month DATE) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    partition_name TEXT;
+    key_column TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT a.attname INTO key_column
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = parent::regclass;
+
+    WHILE month_start <= to_month LOOP
+        partition_name := parent || '_p' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent
+            );
+            IF to_regclass(parent || '_default') IS NOT NULL THEN
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                    parent || '_default', key_column, month_start,
+                    key_column, (month_start + INTERVAL '1 month')::date, partition_name
+                );
+            END IF;
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent, partition_name, month_start, (month_start + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Same naming (sessions_pYYYYMM) and the same move out of sessions_default
+CREATE OR REPLACE FUNCTION sessions_ensure_partitions(from_month DATE, to_month DATE) RETURNS INTEGER AS $$
+    SELECT ensure_monthly_partitions('sessions', from_month, to_month);
+$$ LANGUAGE sql;
+
+-- Month partitions of parent starting after the current month, and rows waiting in its default partition
+CREATE OR REPLACE FUNCTION partition_health(parent TEXT, OUT future_partitions INTEGER, OUT default_rows BIGINT) AS $$
+BEGIN
+    SELECT COUNT(*) INTO future_partitions
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = parent::regclass
+      AND c.relname ~ ('^' || parent || '_p[0-9]{6}$')
+      AND to_date(right(c.relname, 6), 'YYYYMM') > date_trunc('month', CURRENT_DATE);
+    EXECUTE format('SELECT COUNT(*) FROM %I', parent || '_default') INTO default_rows;
+END;
+$$ LANGUAGE plpgsql STABLE;
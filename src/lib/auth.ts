@@ -15,6 +15,55 @@ export interface AuthResponse {
   user: User;
 }
 
+export interface UsersQuery {
+  cursor?: string | null;
+  limit?: number;
+  sort?: 'createdAt' | 'lastLogin' | 'energy' | 'id';
+  order?: 'asc' | 'desc';
+  isAdmin?: boolean;
+  isInfiniteEnergy?: boolean;
+  // Range filters need the matching sort: energy, createdAt or lastLogin respectively
+  minEnergy?: number;
+  maxEnergy?: number;
+  createdFrom?: string;
+  createdTo?: string;
+  lastLoginFrom?: string;
+  lastLoginTo?: string;
+}
+
+export interface BatchResult<T = any> {
+  action: string | null;
+  status: number;
+  body: T;
+  headers?: Record<string, string>;
+  etag?: string;
+}
+
+// Last response per request body: polls send its ETag and reuse the data on 304
+const conditionalCache = new Map<string, { etag: string; data: any }>();
+
+async function conditionalFetch(body: Record<string, unknown>, errorMessage: string) {
+  const token = authService.getToken();
+  const key = JSON.stringify(body);
+  const cached = conditionalCache.get(key);
+  const response = await fetch(ADMIN_API, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'X-Auth-Token': token || '',
+      ...(cached ? { 'If-None-Match': cached.etag } : {})
+    },
+    body: key
+  });
+  
+  if (response.status === 304 && cached) return cached.data;
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.error || errorMessage);
+  const etag = response.headers.get('ETag');
+  if (etag) conditionalCache.set(key, { etag, data });
+  return data;
+}
+
 export const authService = {
   async register(email: string, username: string, password: string): Promise<AuthResponse> {
     const response = await fetch(AUTH_API, {
@@ -57,6 +106,7 @@ export const authService = {
     }
     localStorage.removeItem('auth_token');
     localStorage.removeItem('user');
+    conditionalCache.clear();
   },
 
   async verifyToken(): Promise<User | null> {
@@ -106,23 +156,39 @@ export const authService = {
 };
 
 export const adminService = {
-  async getStats() {
+  // Items share conditionalCache with conditionalFetch: each sends its last ETag as ifNoneMatch,
+  // and a 304 item comes back as the cached 200 body
+  async batch(items: Record<string, unknown>[], snapshot: boolean = false): Promise<BatchResult[]> {
     const token = authService.getToken();
+    const keys = items.map((item) => JSON.stringify(item));
+    const conditionalItems = items.map((item, index) => {
+      const cached = conditionalCache.get(keys[index]);
+      return cached ? { ...item, ifNoneMatch: cached.etag } : item;
+    });
     const response = await fetch(ADMIN_API, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
         'X-Auth-Token': token || ''
       },
-      body: JSON.stringify({ action: 'get_stats' })
+      body: JSON.stringify(snapshot ? { batch: conditionalItems, snapshot: true } : conditionalItems)
     });
     
     const data = await response.json();
-    if (!response.ok) throw new Error(data.error || 'Failed to fetch stats');
-    return data;
+    if (!response.ok) throw new Error(data.error || 'Failed to run batch');
+    return (data as BatchResult[]).map((result, index) => {
+      const cached = conditionalCache.get(keys[index]);
+      if (result.status === 304 && cached) return { ...result, status: 200, body: cached.data };
+      if (result.status === 200 && result.etag) conditionalCache.set(keys[index], { etag: result.etag, data: result.body });
+      return result;
+    });
+  },
+
+  async getUsers(params: UsersQuery = {}) {
+    return conditionalFetch({ action: 'get_users', ...params }, 'Failed to fetch users');
   },
 
-  async getUsers() {
+  async searchUsers(query: string, limit: number = 20) {
     const token = authService.getToken();
     const response = await fetch(ADMIN_API, {
       method: 'POST',
@@ -130,11 +196,11 @@ export const adminService = {
         'Content-Type': 'application/json',
         'X-Auth-Token': token || ''
       },
-      body: JSON.stringify({ action: 'get_users' })
+      body: JSON.stringify({ action: 'search_users', query, limit })
     });
     
     const data = await response.json();
-    if (!response.ok) throw new Error(data.error || 'Failed to fetch users');
+    if (!response.ok) throw new Error(data.error || 'Failed to search users');
     return data;
   },
 
@@ -15,12 +15,38 @@ const Dashboard = () => {
   const [user, setUser] = useState<User | null>(null);
   const [stats, setStats] = useState<any>(null);
   const [users, setUsers] = useState<any[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState<any[] | null>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     checkAuth();
   }, []);
 
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const data = await adminService.searchUsers(query);
+        if (!cancelled) setSearchResults(data.users);
+      } catch (error: any) {
+        if (!cancelled) {
+          toast({ title: "Ошибка поиска", description: error.message, variant: "destructive" });
+        }
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery]);
+
   const checkAuth = async () => {
     const currentUser = await authService.verifyToken();
     if (!currentUser) {
@@ -37,12 +63,31 @@ const Dashboard = () => {
 
   const loadAdminData = async () => {
     try {
-      const [statsData, usersData] = await Promise.all([
-        adminService.getStats(),
-        adminService.getUsers()
-      ]);
-      setStats(statsData);
-      setUsers(usersData.users);
+      // One request: a single admin check and one consistent snapshot for both panels
+      const [statsResult, usersResult] = await adminService.batch(
+        [{ action: 'get_stats' }, { action: 'get_users' }],
+        true
+      );
+      if (statsResult.status !== 200) throw new Error(statsResult.body.error || 'Failed to fetch stats');
+      if (usersResult.status !== 200) throw new Error(usersResult.body.error || 'Failed to fetch users');
+      setStats(statsResult.body);
+      setUsers(usersResult.body.users);
+      setNextCursor(usersResult.body.nextCursor);
+    } catch (error: any) {
+      toast({ 
+        title: "Ошибка загрузки данных", 
+        description: error.message,
+        variant: "destructive" 
+      });
+    }
+  };
+
+  const loadMoreUsers = async () => {
+    if (!nextCursor) return;
+    try {
+      const usersData = await adminService.getUsers({ cursor: nextCursor });
+      setUsers((prev) => [...prev, ...usersData.users]);
+      setNextCursor(usersData.nextCursor);
     } catch (error: any) {
       toast({ 
         title: "Ошибка загрузки данных", 
@@ -239,6 +284,12 @@ const Dashboard = () => {
                 <CardDescription>Выдача и списание энергии</CardDescription>
               </CardHeader>
               <CardContent>
+                <Input
+                  placeholder="Поиск по email или имени"
+                  value={searchQuery}
+                  onChange={(e) => setSearchQuery(e.target.value)}
+                  className="mb-4"
+                />
                 <Table>
                   <TableHeader>
                     <TableRow>
@@ -250,7 +301,7 @@ const Dashboard = () => {
                     </TableRow>
                   </TableHeader>
                   <TableBody>
-                    {users.map((u) => (
+                    {(searchResults ?? users).map((u) => (
                       <TableRow key={u.id}>
                         <TableCell>{u.username}</TableCell>
                         <TableCell>{u.email}</TableCell>
@@ -292,6 +343,13 @@ const Dashboard = () => {
                     ))}
                   </TableBody>
                 </Table>
+                {nextCursor && searchResults === null && (
+                  <div className="flex justify-center mt-4">
+                    <Button variant="outline" onClick={loadMoreUsers}>
+                      Показать ещё
+                    </Button>
+                  </div>
+                )}
               </CardContent>
             </Card>
           </>